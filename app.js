@@ -1,91 +1,532 @@
 const express = require('express');
 const http = require('http');
 const cors = require('cors');
+const crypto = require('crypto');
+const fs = require('fs');
 const path = require('path');
-const { v4: uuidv4 } = require('uuid');
+const zlib = require('zlib');
 require('dotenv').config();
 
-const { CheckoutURLExtractor } = require('./checkoutAgent');
-const { PaymentURLExtractorV2 } = require('./paymentAgentV2'); // Updated to use HyperAgent version
-const { FranceShopifyCheckoutExtractor } = require('./franceShopifyAgent');
+// Outbound Hyperbrowser calls resolve DNS on libuv's threadpool (default 4 threads).
+// Widen it before first use so concurrent analyses don't queue behind each other.
+process.env.UV_THREADPOOL_SIZE = process.env.UV_THREADPOOL_SIZE || '16';
+
+// Extractor modules (and the Hyperbrowser SDK behind them) are required where
+// they are first used, so page, health and session requests - and serverless
+// cold starts that never run an analysis - don't pay to load them.
 
 const app = express();
+
+// res.json() already serializes with V8's native JSON.stringify; the extra
+// per-response cost is Express hashing every body for an ETag. API responses
+// are polled live state that is never revalidated, so skip it.
+app.set('etag', false);
+
+// Don't send the X-Powered-By: Express header on every response
+app.disable('x-powered-by');
 const server = http.createServer(app);
 
+// The synchronous /api/url and /api/payment endpoints hold a request open for
+// the whole extraction: up to a minute queued for a slot plus a 5 minute run.
+// Node's default requestTimeout is 5 minutes, so raise it to keep those
+// requests from being cut off mid-run.
+server.requestTimeout = 7 * 60 * 1000;
+
+// Keep idle connections open long enough for pollers and health probes to reuse them
+server.keepAliveTimeout = 30 * 1000;
+
+// Cross-origin Socket.IO clients allowed: localhost by default, plus any exact
+// origins listed in SOCKET_ALLOWED_ORIGINS (comma-separated). The bundled pages
+// are same-origin and need no entry.
+const SOCKET_ALLOWED_ORIGINS = [
+    /^https?:\/\/(localhost|127\.0\.0\.1)(:\d+)?$/,
+    ...(process.env.SOCKET_ALLOWED_ORIGINS || '').split(',').map((origin) => origin.trim()).filter(Boolean)
+];
+
+// CORS only governs the long-polling transport; WebSocket upgrades carry an
+// Origin header but are never checked against it, so every Socket.IO
+// handshake is also screened here. Requests without an Origin (non-browser
+// clients) and pages served by this host itself are always let through.
+function isAllowedOrigin(origin, host) {
+    if (!origin) {
+        return true;
+    }
+    try {
+        if (new URL(origin).host === host) {
+            return true;
+        }
+    } catch {
+        return false;
+    }
+    return SOCKET_ALLOWED_ORIGINS.some((allowed) =>
+        typeof allowed === 'string' ? allowed === origin : allowed.test(origin));
+}
+
 // Configure Socket.IO with CORS (only for local development)
 let io = null;
 if (process.env.NODE_ENV !== 'production' || process.env.VERCEL !== '1') {
     const socketIo = require('socket.io');
     io = socketIo(server, {
+        // One long-lived WebSocket per dashboard. The pages connect with
+        // tryAllTransports, so they fall back to polling where WebSockets are blocked.
+        transports: ['websocket', 'polling'],
         cors: {
-            origin: "*",
+            origin: SOCKET_ALLOWED_ORIGINS,
             methods: ["GET", "POST"]
+        },
+        allowRequest: (req, callback) => {
+            callback(null, isAllowedOrigin(req.headers.origin, req.headers.host));
         }
     });
 }
 
+// Static pages only change between deployments, so let clients cache them in production
+const STATIC_MAX_AGE = process.env.NODE_ENV === 'production' ? 10 * 60 * 1000 : 0;
+
+// HTML pages are read once at startup and served straight from memory, with
+// an ETag computed at the same time. res.send() answers a matching
+// If-None-Match with a bodiless 304, so revalidating browsers and CDNs don't
+// download the page again.
+function loadPage(file) {
+    const body = fs.readFileSync(path.join(__dirname, 'public', file));
+    const etag = `"${crypto.createHash('sha1').update(body).digest('base64url')}"`;
+    return { body, etag };
+}
+
+const PAGES = {
+    'index': loadPage('index.html'),
+    'api-docs': loadPage('api-docs.html'),
+    'paymenturlfinder': loadPage('paymenturlfinder.html'),
+    'france-shopify': loadPage('france-shopify.html')
+};
+
+function sendPage(res, name) {
+    const page = PAGES[name];
+    res.set('Cache-Control', `public, max-age=${STATIC_MAX_AGE / 1000}`);
+    res.set('ETag', page.etag);
+    res.type('html').send(page.body);
+}
+
+// Gzip larger JSON bodies (session state with progress logs, session listings)
+// when the client accepts it; small responses go out as-is.
+const GZIP_MIN_BYTES = 1024;
+function sendJson(req, res, body) {
+    const json = JSON.stringify(body);
+    res.set('Vary', 'Accept-Encoding');
+    if (json.length < GZIP_MIN_BYTES || !/\bgzip\b/.test(req.headers['accept-encoding'] || '')) {
+        return res.type('json').send(json);
+    }
+    zlib.gzip(json, (error, compressed) => {
+        if (error) {
+            return res.type('json').send(json);
+        }
+        res.set('Content-Encoding', 'gzip');
+        res.type('json').send(compressed);
+    });
+}
+
 // Middleware
 app.use(cors());
 app.use(express.json());
-app.use(express.static('public'));
+app.use(express.static('public', { maxAge: STATIC_MAX_AGE, index: false }));
 
 // Store active sessions
+// Bounded so a long-lived process doesn't keep every result forever: records
+// expire after SESSION_TTL_MS and the oldest are evicted beyond MAX_SESSIONS.
+const MAX_SESSIONS = parseInt(process.env.MAX_SESSIONS, 10) || 1000;
+const SESSION_TTL_MS = 60 * 60 * 1000;
 const activeSessions = new Map();
+// Pending hard-timeout timers, cleared as soon as their session is finished
+// or dropped so none outlives the session it guards
+const sessionTimers = new Map();
+
+function storeSession(sessionId, session) {
+    activeSessions.set(sessionId, session);
+    // Map iterates in insertion order, so the first key is always the oldest
+    while (activeSessions.size > MAX_SESSIONS) {
+        dropSession(activeSessions.keys().next().value);
+    }
+}
+
+function dropSession(sessionId) {
+    activeSessions.delete(sessionId);
+    clearSessionTimer(sessionId);
+}
+
+function clearSessionTimer(sessionId) {
+    const timer = sessionTimers.get(sessionId);
+    if (timer) {
+        clearTimeout(timer);
+        sessionTimers.delete(sessionId);
+    }
+}
+
+setInterval(() => {
+    const cutoff = Date.now() - SESSION_TTL_MS;
+    for (const [sessionId, session] of activeSessions) {
+        if (Date.parse(session.start_time) > cutoff) break;
+        dropSession(sessionId);
+    }
+}, 5 * 60 * 1000).unref();
+
+// Session IDs: 128 random bits, URL-safe and shorter than a formatted UUID
+function newSessionId() {
+    return crypto.randomBytes(16).toString('base64url');
+}
+
+// Timestamps are stored as ISO strings when they're assigned, so the session
+// and status endpoints serialize them as-is. Progress messages tend to arrive
+// in bursts, so the formatted string is reused while the clock hasn't moved
+// instead of building a new Date string per message.
+let lastTimestampMs = 0;
+let lastTimestamp = '';
+function isoNow() {
+    const now = Date.now();
+    if (now !== lastTimestampMs) {
+        lastTimestampMs = now;
+        lastTimestamp = new Date(now).toISOString();
+    }
+    return lastTimestamp;
+}
+
+// Website URLs are checked before any browser session is started, so a typo
+// gets a 400 instead of a multi-minute run that fails. A missing scheme
+// defaults to https://, and anything other than http(s) with a dotted host
+// name is rejected. The URL parser lowercases the host and drops default
+// ports, so each site has one spelling in the session records. The fragment
+// is kept because hash-routed shops and some checkout links depend on it.
+// Results, including rejections, are memoized per raw input, because clients
+// tend to submit the same few URLs again and again.
+// Returns the normalized URL, or null when it is not usable.
+const NORMALIZED_URL_CACHE_MAX_ENTRIES = 4096;
+const normalizedUrlCache = new Map();
+
+function normalizeUrl(rawUrl) {
+    if (typeof rawUrl !== 'string') return null;
+
+    if (normalizedUrlCache.has(rawUrl)) {
+        return normalizedUrlCache.get(rawUrl);
+    }
+    if (normalizedUrlCache.size >= NORMALIZED_URL_CACHE_MAX_ENTRIES) {
+        normalizedUrlCache.delete(normalizedUrlCache.keys().next().value);
+    }
+    const normalized = parseWebsiteUrl(rawUrl);
+    normalizedUrlCache.set(rawUrl, normalized);
+    return normalized;
+}
+
+function parseWebsiteUrl(rawUrl) {
+    const trimmed = rawUrl.trim();
+    const withScheme = /^[a-z][a-z0-9+.-]*:\/\//i.test(trimmed) ? trimmed : `https://${trimmed}`;
+
+    let parsed;
+    try {
+        parsed = new URL(withScheme);
+    } catch {
+        return null;
+    }
+    if ((parsed.protocol !== 'http:' && parsed.protocol !== 'https:') || !parsed.hostname.includes('.')) {
+        return null;
+    }
+    return parsed.href;
+}
+
+// The extractors keep no per-run state, so a single instance of each (and the
+// Hyperbrowser client they share) serves every analysis instead of being
+// rebuilt, with a fresh connection pool, for each request.
+let checkoutExtractor = null;
+function getCheckoutExtractor() {
+    if (!checkoutExtractor) {
+        const { CheckoutURLExtractor } = require('./checkoutAgent');
+        checkoutExtractor = new CheckoutURLExtractor(5); // 5 minute maximum timeout for French webshops with account creation
+        console.log("✅ CheckoutURLExtractor initialized successfully");
+    }
+    return checkoutExtractor;
+}
+
+let paymentExtractor = null;
+function getPaymentExtractor() {
+    if (!paymentExtractor) {
+        const { PaymentURLExtractorV2 } = require('./paymentAgentV2');
+        paymentExtractor = new PaymentURLExtractorV2(5); // 5 minute maximum timeout for French webshops with account creation
+        console.log("✅ PaymentURLExtractorV2 initialized successfully");
+    }
+    return paymentExtractor;
+}
+
+let franceShopifyExtractor = null;
+function getFranceShopifyExtractor() {
+    if (!franceShopifyExtractor) {
+        const { FranceShopifyCheckoutExtractor } = require('./franceShopifyAgent');
+        franceShopifyExtractor = new FranceShopifyCheckoutExtractor(4); // 4 minute timeout for Shopify
+        console.log("✅ FranceShopifyCheckoutExtractor initialized successfully");
+    }
+    return franceShopifyExtractor;
+}
+
+// Move a session into a terminal state exactly once. Whichever of the
+// extraction and the hard timeout finishes first wins; the loser is ignored
+// so a late result can't flip a timed-out session back (or vice versa).
+// Returns the session if this call finished it, otherwise null.
+function finishSession(sessionId, updates) {
+    const session = activeSessions.get(sessionId);
+    if (!session || session.status === 'completed' || session.status === 'error') {
+        return null;
+    }
+    clearSessionTimer(sessionId);
+    Object.assign(session, { end_time: isoNow() }, updates);
+    return session;
+}
 
 // Helper: schedule a hard timeout for session records to stop endless polling
 function scheduleSessionTimeout(sessionId, minutes = 5, slackMs = 2000) {
     const timeoutMs = Math.round(minutes * 60 * 1000 + slackMs);
-    setTimeout(() => {
-        const session = activeSessions.get(sessionId);
-        if (!session) return;
+    sessionTimers.set(sessionId, setTimeout(() => {
         // If still not terminal, mark as error/timeout so clients stop polling
-        const isTerminal = session.status === 'completed' || session.status === 'error';
-        if (!isTerminal) {
-            session.status = 'error';
-            session.error = `Timed out after ${minutes} minutes`;
-            session.end_time = new Date().toISOString();
+        const session = finishSession(sessionId, {
+            status: 'error',
+            error: `Timed out after ${minutes} minutes`
+        });
+        if (session) {
             session.progress = session.progress || [];
             session.progress.push({
                 message: `🛑 Server timeout: stopped polling after ${minutes} minutes`,
                 timestamp: session.end_time
             });
-            if (io) {
-                io.emit('analysis_error', { session_id: sessionId, error: session.error });
-            }
+            emitSessionEvent(sessionId, 'analysis_error', { session_id: sessionId, error: session.error });
         }
-    }, timeoutMs);
+    }, timeoutMs));
+}
+
+// Admission control for extractions. Each analysis holds slots while it runs,
+// one per browser session it may open at once, and at most
+// MAX_RUNNING_ANALYSES slots are in use at a time. Analyses that don't fit
+// wait in arrival order for up to ANALYSIS_QUEUE_MAX_WAIT_MS. Once
+// MAX_QUEUED_ANALYSES are waiting, new requests get a 503 with Retry-After,
+// so a burst can't pile up an unbounded number of browser sessions.
+const MAX_RUNNING_ANALYSES = parseInt(process.env.MAX_RUNNING_ANALYSES, 10) || 16;
+const MAX_QUEUED_ANALYSES = parseInt(process.env.MAX_QUEUED_ANALYSES, 10) || 32;
+const ANALYSIS_QUEUE_MAX_WAIT_MS = 60 * 1000;
+let slotsInUse = 0;
+const analysisQueue = [];
+
+// Returns true (after sending the 503) when the queue is full.
+function rejectWhenBusy(res) {
+    if (analysisQueue.length < MAX_QUEUED_ANALYSES) {
+        return false;
+    }
+    res.set('Retry-After', '30');
+    res.status(503).json({ error: 'Too many analyses in progress, please retry shortly' });
+    return true;
+}
+
+function slotsFree(slots) {
+    return analysisQueue.length === 0 && slotsInUse + slots <= MAX_RUNNING_ANALYSES;
+}
+
+// Resolves with the number of slots taken once they are free, or rejects
+// when the wait exceeds ANALYSIS_QUEUE_MAX_WAIT_MS
+function acquireAnalysisSlots(slots) {
+    const wanted = Math.min(slots, MAX_RUNNING_ANALYSES);
+    if (wanted === 0 || slotsFree(wanted)) {
+        slotsInUse += wanted;
+        return Promise.resolve(wanted);
+    }
+    return new Promise((resolve, reject) => {
+        const waiter = { slots: wanted, resolve };
+        waiter.timer = setTimeout(() => {
+            analysisQueue.splice(analysisQueue.indexOf(waiter), 1);
+            reject(new Error(`No analysis slot became free within ${ANALYSIS_QUEUE_MAX_WAIT_MS / 1000} seconds`));
+            grantQueuedSlots();
+        }, ANALYSIS_QUEUE_MAX_WAIT_MS);
+        analysisQueue.push(waiter);
+    });
+}
+
+function releaseAnalysisSlots(slots) {
+    slotsInUse -= slots;
+    grantQueuedSlots();
+}
+
+// Hand freed slots to waiters in arrival order, as long as the first one fits
+function grantQueuedSlots() {
+    while (analysisQueue.length > 0 && slotsInUse + analysisQueue[0].slots <= MAX_RUNNING_ANALYSES) {
+        const waiter = analysisQueue.shift();
+        clearTimeout(waiter.timer);
+        slotsInUse += waiter.slots;
+        waiter.resolve(waiter.slots);
+    }
+}
+
+// Run an extraction for a session on the shared event loop.
+// The task resolves with the extraction result; completion/error bookkeeping
+// and Socket.IO notifications are handled here for every endpoint. The returned
+// promise never rejects: it resolves with the session record once it's terminal,
+// so synchronous endpoints await it and background ones simply don't.
+// Options:
+//   timeoutMinutes - the session's hard timeout, started once the task starts
+//   slots          - browser sessions the task may run at once
+//   isDuplicate    - true when the task would only wait on another run (a
+//                    cached result or an in-flight extraction); such tasks
+//                    start straight away without taking slots
+//   describeError  - progress message recorded when the task fails
+function runAnalysis(sessionId, label, task, options = {}) {
+    const {
+        timeoutMinutes = 5,
+        slots = 1,
+        isDuplicate = () => false,
+        describeError = (error) => `Error: ${error.message}`
+    } = options;
+    const session = activeSessions.get(sessionId);
+
+    const wanted = isDuplicate() ? 0 : slots;
+    if (wanted > 0 && !slotsFree(Math.min(wanted, MAX_RUNNING_ANALYSES))) {
+        session.progress.push({
+            message: '⏳ Waiting for a free analysis slot...',
+            timestamp: isoNow()
+        });
+    }
+
+    let held = 0;
+    return acquireAnalysisSlots(wanted)
+        .then((acquired) => {
+            held = acquired;
+            // Another run for the same URL may have started while this one was queued
+            if (held > 0 && isDuplicate()) {
+                releaseAnalysisSlots(held);
+                held = 0;
+            }
+            scheduleSessionTimeout(sessionId, timeoutMinutes);
+            return task();
+        })
+        .then((result) => {
+            if (finishSession(sessionId, { result: result, status: 'completed' })) {
+                emitSessionEvent(sessionId, 'analysis_complete', { session_id: sessionId, result: result });
+            }
+        })
+        .catch((error) => {
+            console.error(`Error during ${label} for session ${sessionId}:`, error);
+            if (finishSession(sessionId, { status: 'error', error: error.message })) {
+                session.progress.push({
+                    message: describeError(error),
+                    timestamp: isoNow()
+                });
+                emitSessionEvent(sessionId, 'analysis_error', { session_id: sessionId, error: error.message });
+            }
+        })
+        .finally(() => releaseAnalysisSlots(held))
+        .then(() => session);
+}
+
+// Whether the shared checkout extractor would answer from its cache or an
+// in-flight run. An extractor that hasn't been created yet has neither.
+function checkoutResultShared(websiteUrl, options) {
+    return Boolean(checkoutExtractor && checkoutExtractor.wouldReuseResult(websiteUrl, options));
+}
+
+// Overlapping requests for the same extraction share one extractor run: the
+// first caller starts it, and later callers get a progress note and the same
+// promise. The checkout extractor already coalesces its own calls, so this
+// covers the payment and French Shopify extractors. The key is the extractor
+// name plus the URL without its fragment, the same way
+// CheckoutURLExtractor._cacheKey builds its keys.
+const inFlightExtractions = new Map();
+
+function extractionKey(kind, url) {
+    const hashIndex = url.indexOf('#');
+    return `${kind} ${hashIndex === -1 ? url : url.slice(0, hashIndex)}`;
+}
+
+function shareExtraction(kind, url, progressCallback, start) {
+    const key = extractionKey(kind, url);
+    const pending = inFlightExtractions.get(key);
+    if (pending) {
+        progressCallback("⏳ This URL is already being analyzed, waiting for that result...");
+        return pending;
+    }
+
+    const extraction = Promise.resolve().then(start);
+    inFlightExtractions.set(key, extraction);
+    extraction
+        .catch(() => {})
+        .then(() => inFlightExtractions.delete(key));
+    return extraction;
+}
+
+// Socket.IO progress is coalesced per session: messages are queued and sent as
+// one progress_batch event every PROGRESS_FLUSH_MS (or as soon as
+// PROGRESS_BATCH_MAX messages are waiting), and any queued messages are
+// flushed ahead of a session's terminal event so clients see them in order.
+const PROGRESS_FLUSH_MS = 100;
+const PROGRESS_BATCH_MAX = 16;
+const pendingProgress = new Map();
+
+function queueProgress(sessionId, entry) {
+    let pending = pendingProgress.get(sessionId);
+    if (!pending) {
+        pending = { entries: [], timer: setTimeout(() => flushProgress(sessionId), PROGRESS_FLUSH_MS) };
+        pendingProgress.set(sessionId, pending);
+    }
+    pending.entries.push(entry);
+    if (pending.entries.length >= PROGRESS_BATCH_MAX) {
+        flushProgress(sessionId);
+    }
+}
+
+function flushProgress(sessionId) {
+    const pending = pendingProgress.get(sessionId);
+    if (!pending) return;
+
+    pendingProgress.delete(sessionId);
+    clearTimeout(pending.timer);
+    io.to(sessionId).emit('progress_batch', { session_id: sessionId, messages: pending.entries });
+}
+
+function emitSessionEvent(sessionId, event, payload) {
+    if (!io) return;
+    flushProgress(sessionId);
+    io.to(sessionId).emit(event, payload);
 }
 
 // Web Progress Callback class
+// Records each message on the session and queues it for Socket.IO delivery.
+// `call` is bound once so it can be handed straight to the extractors.
 class WebProgressCallback {
     constructor(sessionId) {
         this.sessionId = sessionId;
+        this.call = this.call.bind(this);
     }
 
     call(message) {
+        const entry = {
+            message: message,
+            timestamp: isoNow()
+        };
+
+        const session = activeSessions.get(this.sessionId);
+        if (session) {
+            session.progress.push(entry);
+        }
+
         if (io) {
-            io.emit('progress_update', {
-                session_id: this.sessionId,
-                message: message,
-                timestamp: new Date().toISOString()
-            });
+            queueProgress(this.sessionId, entry);
         }
     }
 }
 
 // Routes
 app.get('/', (req, res) => {
-    res.sendFile(path.join(__dirname, 'public', 'index.html'));
+    sendPage(res, 'index');
 });
 
 // API Documentation page
 app.get('/api', (req, res) => {
-    res.sendFile(path.join(__dirname, 'public', 'api-docs.html'));
+    sendPage(res, 'api-docs');
 });
 
 // Payment URL Finder page
 app.get('/paymenturlfinder', (req, res) => {
-    res.sendFile(path.join(__dirname, 'public', 'paymenturlfinder.html'));
+    sendPage(res, 'paymenturlfinder');
 });
 
 // French Shopify GET endpoint: GET /api/france/shopify/:encoded_url
@@ -97,115 +538,62 @@ app.get('/api/france/shopify/:encoded_url(*)', async (req, res) => {
             return res.status(400).json({ error: 'URL is required' });
         }
 
-        // Decode the URL
-        const websiteUrl = decodeURIComponent(encodedUrl);
-        
-        console.log(`🔍 Debug - Encoded URL: ${encodedUrl}`);
-        console.log(`🔍 Debug - Decoded URL: ${websiteUrl}`);
-        
-        // Enhanced URL validation
-        try {
-            const url = new URL(websiteUrl);
-            if (url.protocol !== 'http:' && url.protocol !== 'https:') {
-                console.log(`❌ Debug - Invalid protocol: ${url.protocol}`);
-                return res.status(400).json({ error: 'URL must start with http:// or https://' });
-            }
-        } catch (error) {
-            console.log(`❌ Debug - URL parsing error: ${error.message}`);
-            return res.status(400).json({ error: 'Invalid URL format' });
+        // Decode and validate the URL
+        const websiteUrl = normalizeUrl(decodeURIComponent(encodedUrl));
+        if (!websiteUrl) {
+            return res.status(400).json({ error: 'URL must be a valid http:// or https:// address' });
         }
 
-        const sessionId = uuidv4();
+        if (rejectWhenBusy(res)) return;
+
+        const sessionId = newSessionId();
 
         // Store session info
-        activeSessions.set(sessionId, {
+        storeSession(sessionId, {
             url: websiteUrl,
             status: 'starting',
-            start_time: new Date().toISOString(),
+            start_time: isoNow(),
             progress: []
         });
 
         console.log(`🇫🇷 Starting French Shopify checkout extraction for: ${websiteUrl}`);
 
-        // Start the extraction process
-        const extractor = new FranceShopifyCheckoutExtractor(4); // 4 minutes timeout
-        
-        // Schedule session timeout
-        scheduleSessionTimeout(sessionId, 4); // 4 minutes timeout
-
-        try {
-            const result = await extractor.extractCheckoutURLWithStreaming(websiteUrl, (message) => {
-                // Update progress
-                if (activeSessions.has(sessionId)) {
-                    activeSessions.get(sessionId).progress.push({
-                        message,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-                
-                // Emit progress via Socket.IO if available
-                if (io) {
-                    io.emit('analysis_progress', { session_id: sessionId, message });
-                }
-            });
-
-            // Update session status
-            if (activeSessions.has(sessionId)) {
-                activeSessions.get(sessionId).status = 'completed';
-                activeSessions.get(sessionId).end_time = new Date().toISOString();
-            }
+        const session = await runAnalysis(sessionId, 'French Shopify checkout extraction', async () => {
+            const extractor = getFranceShopifyExtractor();
 
-            // Emit completion via Socket.IO if available
-            if (io) {
-                io.emit('analysis_complete', { session_id: sessionId, result });
-            }
+            const progressCallback = new WebProgressCallback(sessionId);
+            return shareExtraction('france-shopify', websiteUrl, progressCallback.call,
+                () => extractor.extractCheckoutURLWithStreaming(websiteUrl, progressCallback.call));
+        }, {
+            timeoutMinutes: 4,
+            isDuplicate: () => inFlightExtractions.has(extractionKey('france-shopify', websiteUrl))
+        });
 
+        if (session.status === 'completed') {
             // Return success response
-            res.json({
+            return res.json({
                 session_id: sessionId,
                 status: 'completed',
                 message: 'French Shopify checkout extraction completed',
                 url: websiteUrl,
-                start_time: activeSessions.get(sessionId)?.start_time,
-                end_time: activeSessions.get(sessionId)?.end_time,
-                result: result
-            });
-
-        } catch (error) {
-            console.error('Error in French Shopify checkout extraction:', error);
-            
-            const endTime = new Date().toISOString();
-            
-            if (activeSessions.has(sessionId)) {
-                activeSessions.get(sessionId).status = 'error';
-                activeSessions.get(sessionId).end_time = endTime;
-            }
-            
-            const errorMessage = `Error: ${error.message}`;
-            if (activeSessions.get(sessionId)) {
-                activeSessions.get(sessionId).progress.push({
-                    message: errorMessage,
-                    timestamp: new Date().toISOString()
-                });
-            }
-            
-            if (io) {
-                io.emit('analysis_error', { session_id: sessionId, error: error.message });
-            }
-
-            // Return error response
-            res.status(500).json({
-                session_id: sessionId,
-                status: 'error',
-                message: 'French Shopify checkout extraction failed',
-                url: websiteUrl,
-                start_time: activeSessions.get(sessionId)?.start_time,
-                end_time: endTime,
-                error: error.message,
-                progress: activeSessions.get(sessionId)?.progress || []
+                start_time: session.start_time,
+                end_time: session.end_time,
+                result: session.result
             });
         }
 
+        // Return error response
+        res.status(500).json({
+            session_id: sessionId,
+            status: 'error',
+            message: 'French Shopify checkout extraction failed',
+            url: websiteUrl,
+            start_time: session.start_time,
+            end_time: session.end_time,
+            error: session.error,
+            progress: session.progress
+        });
+
     } catch (error) {
         console.error('Error in French Shopify GET endpoint:', error);
         res.status(500).json({ error: 'Internal server error' });
@@ -214,103 +602,50 @@ app.get('/api/france/shopify/:encoded_url(*)', async (req, res) => {
 
 // French Shopify page
 app.get('/france-shopify', (req, res) => {
-    res.sendFile(path.join(__dirname, 'public', 'france-shopify.html'));
+    sendPage(res, 'france-shopify');
 });
 
 
 app.post('/api/analyze', async (req, res) => {
     try {
         const { url } = req.body;
+        // Skip the extractor's recent-result cache: { "refresh": true } or ?refresh=1
+        const refresh = req.body.refresh === true || req.query.refresh === '1';
         
         if (!url || !url.trim()) {
             return res.status(400).json({ error: 'URL is required' });
         }
 
-        const sessionId = uuidv4();
-        const websiteUrl = url.trim();
+        const websiteUrl = normalizeUrl(url);
+        if (!websiteUrl) {
+            return res.status(400).json({ error: 'URL must be a valid http:// or https:// address' });
+        }
+
+        if (rejectWhenBusy(res)) return;
+
+        const sessionId = newSessionId();
 
         // Store session info
-        activeSessions.set(sessionId, {
+        storeSession(sessionId, {
             url: websiteUrl,
             status: 'starting',
-            start_time: new Date().toISOString(),
+            start_time: isoNow(),
             progress: [],
             result: null
         });
 
-        // Ensure polling callers stop after hard timeout
-        scheduleSessionTimeout(sessionId, 5, 2000);
-
-        // Start analysis in background
-        setImmediate(async () => {
-            try {
-                // Log environment variables being used (for debugging)
-                console.log("🔍 Vercel Runtime Environment Check:");
-                console.log(`HYPERBROWSER_API_KEY (first 5 chars): ${process.env.HYPERBROWSER_API_KEY ? process.env.HYPERBROWSER_API_KEY.substring(0, 5) + '...' : 'NOT SET'}`);
-                console.log(`OPENAI_API_KEY (first 5 chars): ${process.env.OPENAI_API_KEY ? process.env.OPENAI_API_KEY.substring(0, 5) + '...' : 'NOT SET'}`);
-                console.log(`NODE_ENV: ${process.env.NODE_ENV || 'NOT SET'}`);
-                
-                const extractor = new CheckoutURLExtractor(5); // 5 minute maximum timeout for French webshops with account creation
-                console.log("✅ CheckoutURLExtractor initialized successfully");
-                const progressCallback = new WebProgressCallback(sessionId);
-                
-                // Override the call method to emit to Socket.IO
-                progressCallback.call = (message) => {
-                    const session = activeSessions.get(sessionId);
-                    if (session) {
-                        session.progress.push({
-                            message: message,
-                            timestamp: new Date().toISOString()
-                        });
-                    }
-                    
-                    if (io) {
-                        io.emit('progress_update', {
-                            session_id: sessionId,
-                            message: message,
-                            timestamp: new Date().toISOString()
-                        });
-                    }
-                };
-
-                const result = await extractor.extractCheckoutURLWithStreaming(
-                    websiteUrl, 
-                    progressCallback.call.bind(progressCallback)
-                );
-
-                // Update session with result
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.result = result;
-                    session.status = 'completed';
-                    session.end_time = new Date().toISOString();
-                }
-
-                // Emit final result
-                if (io) {
-                    io.emit('analysis_complete', {
-                        session_id: sessionId,
-                        result: result
-                    });
-                }
-
-            } catch (error) {
-                // Update session with error
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.status = 'error';
-                    session.error = error.message;
-                    session.end_time = new Date().toISOString();
-                }
-
-                // Emit error
-                if (io) {
-                    io.emit('analysis_error', {
-                        session_id: sessionId,
-                        error: error.message
-                    });
-                }
-            }
+        // Start analysis in background; polling callers are stopped by its hard timeout
+        runAnalysis(sessionId, 'analysis', async () => {
+            const extractor = getCheckoutExtractor();
+            const progressCallback = new WebProgressCallback(sessionId);
+
+            return extractor.extractCheckoutURLWithStreaming(
+                websiteUrl, 
+                progressCallback.call,
+                { refresh }
+            );
+        }, {
+            isDuplicate: () => checkoutResultShared(websiteUrl, { refresh })
         });
 
         res.json({
@@ -325,6 +660,81 @@ app.post('/api/analyze', async (req, res) => {
     }
 });
 
+// Batch analysis: one session covering several websites, run through the
+// shared extractor at most `maxConcurrentSessions` browser sessions at a time.
+// The session result is an array of { url, result } / { url, error } entries.
+const MAX_BATCH_URLS = 20;
+
+app.post('/api/analyze/batch', async (req, res) => {
+    try {
+        const { urls } = req.body;
+
+        if (!Array.isArray(urls) || urls.length === 0) {
+            return res.status(400).json({ error: 'urls must be a non-empty array' });
+        }
+        if (urls.length > MAX_BATCH_URLS) {
+            return res.status(400).json({ error: `At most ${MAX_BATCH_URLS} URLs per batch` });
+        }
+        const websiteUrls = urls.map(normalizeUrl);
+        const invalidIndex = websiteUrls.indexOf(null);
+        if (invalidIndex !== -1) {
+            return res.status(400).json({ error: `URL at index ${invalidIndex} must be a valid http:// or https:// address` });
+        }
+
+        if (rejectWhenBusy(res)) return;
+
+        // Set up the extractor before creating the session, so a failure here
+        // leaves no session behind
+        const extractor = getCheckoutExtractor();
+
+        // The batch holds one slot per browser session it runs in parallel, and
+        // each wave of parallel sessions gets the single-site 5 minute budget
+        const parallel = Math.min(websiteUrls.length, extractor.maxConcurrentSessions);
+        const waves = Math.ceil(websiteUrls.length / extractor.maxConcurrentSessions);
+
+        const sessionId = newSessionId();
+
+        // Store session info
+        storeSession(sessionId, {
+            url: websiteUrls.join(', '),
+            urls: websiteUrls,
+            status: 'starting',
+            start_time: isoNow(),
+            progress: [],
+            result: null
+        });
+
+        runAnalysis(sessionId, 'batch analysis', async () => {
+            const progressCallback = new WebProgressCallback(sessionId);
+            return extractor.extractCheckoutURLsBatch(websiteUrls, progressCallback.call);
+        }, {
+            timeoutMinutes: 5 * waves,
+            slots: parallel
+        });
+
+        res.json({
+            session_id: sessionId,
+            status: 'started',
+            message: `Batch analysis of ${websiteUrls.length} websites started successfully`
+        });
+
+    } catch (error) {
+        console.error('Error starting batch analysis:', error);
+        res.status(500).json({ error: error.message });
+    }
+});
+
+// Session state for pollers. With ?since=N only progress entries from index N
+// on are included, so a client that already has the first N doesn't download
+// the whole log again on every poll; progress_total tells it where to resume.
+function sessionView(session, since) {
+    const from = parseInt(since, 10);
+    if (!(from > 0)) {
+        return session;
+    }
+    return { ...session, progress: session.progress.slice(from), progress_total: session.progress.length };
+}
+
 app.get('/api/session/:id', (req, res) => {
     const sessionId = req.params.id;
     const session = activeSessions.get(sessionId);
@@ -333,21 +743,42 @@ app.get('/api/session/:id', (req, res) => {
         return res.status(404).json({ error: 'Session not found' });
     }
     
-    res.json(session);
+    sendJson(req, res, sessionView(session, req.query.since));
 });
 
+// Session listing returns metadata only; full results and progress logs are
+// available per session from /api/session/:id. Supports ?offset=&limit=.
 app.get('/api/sessions', (req, res) => {
-    const sessions = Object.fromEntries(activeSessions);
-    res.json(sessions);
+    const offset = Math.max(parseInt(req.query.offset, 10) || 0, 0);
+    // A missing or non-numeric limit lists everything; explicit values (including 0) are clamped
+    const requestedLimit = parseInt(req.query.limit, 10);
+    const limit = Number.isNaN(requestedLimit) ? activeSessions.size : Math.min(Math.max(requestedLimit, 0), activeSessions.size);
+
+    const sessions = {};
+    let index = 0;
+    for (const [sessionId, session] of activeSessions) {
+        if (index++ < offset) continue;
+        if (index > offset + limit) break;
+        sessions[sessionId] = {
+            url: session.url,
+            status: session.status,
+            start_time: session.start_time,
+            end_time: session.end_time,
+            error: session.error
+        };
+    }
+    sendJson(req, res, sessions);
 });
 
 app.get('/health', (req, res) => {
+    // Let load-balancer probes be answered from an edge cache for a few seconds
+    res.set('Cache-Control', 'public, max-age=5');
     res.json({
         status: 'healthy',
         message: 'Payment Provider Extractor is running on Node.js + Vercel',
         version: '2.0.0',
         platform: 'nodejs-vercel',
-        timestamp: new Date().toISOString()
+        timestamp: isoNow()
     });
 });
 
@@ -355,17 +786,31 @@ app.get('/test', (req, res) => {
     res.json({
         message: 'Test endpoint working on Node.js + Vercel!',
         status: 'success',
-        timestamp: new Date().toISOString()
+        timestamp: isoNow()
     });
 });
 
 // Socket.IO connection handling (only for local development)
 if (io) {
     io.on('connection', (socket) => {
-        console.log('Client connected:', socket.id);
-        
-        socket.on('disconnect', () => {
-            console.log('Client disconnected:', socket.id);
+        // Clients subscribe to a single session; events are emitted to that
+        // session's room only. Progress recorded before the join is replayed.
+        socket.on('join_session', (sessionId) => {
+            const session = activeSessions.get(sessionId);
+            if (!session) return;
+
+            // Send anything still pending to the existing members first, so the
+            // replay below is the only copy of it this socket receives
+            flushProgress(sessionId);
+            socket.join(sessionId);
+            if (session.progress.length > 0) {
+                socket.emit('progress_batch', { session_id: sessionId, messages: session.progress, replay: true });
+            }
+            if (session.status === 'completed') {
+                socket.emit('analysis_complete', { session_id: sessionId, result: session.result });
+            } else if (session.status === 'error') {
+                socket.emit('analysis_error', { session_id: sessionId, error: session.error });
+            }
         });
     });
 }
@@ -385,83 +830,39 @@ app.post('/api/payment/extract', async (req, res) => {
             return res.status(400).json({ error: 'Checkout URL is required' });
         }
 
-        const sessionId = uuidv4();
-        const websiteUrl = checkout_url.trim();
+        const websiteUrl = normalizeUrl(checkout_url);
+        if (!websiteUrl) {
+            return res.status(400).json({ error: 'Checkout URL must be a valid http:// or https:// address' });
+        }
+
+        if (rejectWhenBusy(res)) return;
+
+        const sessionId = newSessionId();
 
         // Store session info
-        activeSessions.set(sessionId, {
+        storeSession(sessionId, {
             url: websiteUrl,
             status: 'starting',
-            start_time: new Date().toISOString(),
+            start_time: isoNow(),
             progress: [],
             result: null
         });
 
-        // Ensure polling callers stop after hard timeout
-        scheduleSessionTimeout(sessionId, 5, 2000);
-
-        // Start analysis in background
-        setImmediate(async () => {
-            try {
-                console.log(`🚀 Starting payment extraction for: ${websiteUrl}`);
-                
-                const extractor = new PaymentURLExtractorV2(5); // 5 minute maximum timeout for French webshops with account creation
-                console.log("✅ PaymentURLExtractorV2 initialized successfully");
-                
-                const progressCallback = new WebProgressCallback(sessionId);
-                
-                // Override the call method to emit to Socket.IO (if available)
-                progressCallback.call = (message) => {
-                    const session = activeSessions.get(sessionId);
-                    if (session) {
-                        session.progress.push({
-                            message: message,
-                            timestamp: new Date().toISOString()
-                        });
-                    }
-                    if (io) {
-                        io.emit('progress_update', {
-                            session_id: sessionId,
-                            message: message,
-                            timestamp: new Date().toISOString()
-                        });
-                    }
-                };
-
-                progressCallback.call(`Starting payment gateway extraction for: ${websiteUrl}`);
-                const result = await extractor.extractPaymentURLWithStreaming(websiteUrl, progressCallback.call.bind(progressCallback));
-                
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.result = result;
-                    session.status = 'completed';
-                    session.end_time = new Date().toISOString();
-                }
-                progressCallback.call("Payment gateway extraction completed successfully!");
-                
-                if (io) {
-                    io.emit('analysis_complete', { session_id: sessionId, result: result });
-                }
-
-            } catch (error) {
-                console.error(`Error during payment extraction for session ${sessionId}:`, error);
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.status = 'error';
-                    session.error = error.message;
-                    session.end_time = new Date().toISOString();
-                }
-                const errorMessage = `Error: ${error.message}`;
-                if (activeSessions.get(sessionId)) {
-                    activeSessions.get(sessionId).progress.push({
-                        message: errorMessage,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-                if (io) {
-                    io.emit('analysis_error', { session_id: sessionId, error: error.message });
-                }
-            }
+        // Start analysis in background; polling callers are stopped by its hard timeout
+        runAnalysis(sessionId, 'payment extraction', async () => {
+            console.log(`🚀 Starting payment extraction for: ${websiteUrl}`);
+
+            const extractor = getPaymentExtractor();
+
+            const progressCallback = new WebProgressCallback(sessionId);
+
+            progressCallback.call(`Starting payment gateway extraction for: ${websiteUrl}`);
+            const result = await shareExtraction('payment', websiteUrl, progressCallback.call,
+                () => extractor.extractPaymentURLWithStreaming(websiteUrl, progressCallback.call));
+            progressCallback.call("Payment gateway extraction completed successfully!");
+            return result;
+        }, {
+            isDuplicate: () => inFlightExtractions.has(extractionKey('payment', websiteUrl))
         });
 
         res.json({
@@ -485,7 +886,7 @@ app.get('/api/payment/session/:id', (req, res) => {
         return res.status(404).json({ error: 'Session not found' });
     }
     
-    res.json(session);
+    sendJson(req, res, sessionView(session, req.query.since));
 });
 
 // Direct Payment API endpoint: GET /api/payment/:encoded_url (SYNCHRONOUS)
@@ -497,21 +898,19 @@ app.get('/api/payment/:encoded_url(*)', async (req, res) => {
             return res.status(400).json({ error: 'Checkout URL is required' });
         }
 
-        // Decode the URL parameter
-        const checkoutUrl = decodeURIComponent(encoded_url.trim());
-        
-        // Validate URL format
-        try {
-            new URL(checkoutUrl);
-        } catch (error) {
-            return res.status(400).json({ error: 'Invalid URL format' });
+        // Decode and validate the URL parameter
+        const checkoutUrl = normalizeUrl(decodeURIComponent(encoded_url));
+        if (!checkoutUrl) {
+            return res.status(400).json({ error: 'Checkout URL must be a valid http:// or https:// address' });
         }
 
-        const sessionId = uuidv4();
-        const startTime = new Date().toISOString();
+        if (rejectWhenBusy(res)) return;
+
+        const sessionId = newSessionId();
+        const startTime = isoNow();
 
         // Store session info
-        activeSessions.set(sessionId, {
+        storeSession(sessionId, {
             url: checkoutUrl,
             status: 'running',
             start_time: startTime,
@@ -521,100 +920,48 @@ app.get('/api/payment/:encoded_url(*)', async (req, res) => {
 
         console.log(`🚀 Starting SYNCHRONOUS payment extraction for: ${checkoutUrl}`);
         
-        try {
-            const extractor = new PaymentURLExtractorV2(5); // 5 minute maximum timeout for French webshops with account creation
-            console.log("✅ PaymentURLExtractorV2 initialized successfully");
-            
+        // SYNCHRONOUS EXECUTION - Wait for completion
+        const session = await runAnalysis(sessionId, 'payment extraction', async () => {
+            const extractor = getPaymentExtractor();
+
             const progressCallback = new WebProgressCallback(sessionId);
-            
-            // Override the call method to store progress
-            progressCallback.call = (message) => {
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.progress.push({
-                        message: message,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-                if (io) {
-                    io.emit('progress_update', {
-                        session_id: sessionId,
-                        message: message,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-            };
 
             progressCallback.call(`Starting payment gateway extraction for: ${checkoutUrl}`);
-            
-            // SYNCHRONOUS EXECUTION - Wait for completion
-            const result = await extractor.extractPaymentURLWithStreaming(checkoutUrl, progressCallback.call.bind(progressCallback));
-            
-            const endTime = new Date().toISOString();
-            
-            // Update session with results
-            const session = activeSessions.get(sessionId);
-            if (session) {
-                session.result = result;
-                session.status = 'completed';
-                session.end_time = endTime;
-            }
-            
+            const result = await shareExtraction('payment', checkoutUrl, progressCallback.call,
+                () => extractor.extractPaymentURLWithStreaming(checkoutUrl, progressCallback.call));
             progressCallback.call("Payment gateway extraction completed successfully!");
-            
-            if (io) {
-                io.emit('analysis_complete', { session_id: sessionId, result: result });
-            }
+            return result;
+        }, {
+            isDuplicate: () => inFlightExtractions.has(extractionKey('payment', checkoutUrl))
+        });
 
+        if (session.status === 'completed') {
             // Return complete results immediately
-            res.json({
+            return res.json({
                 session_id: sessionId,
                 status: 'completed',
                 message: 'Payment gateway extraction completed successfully',
                 checkout_url: checkoutUrl,
                 start_time: startTime,
-                end_time: endTime,
-                duration_seconds: Math.round((new Date(endTime) - new Date(startTime)) / 1000),
-                result: result,
-                progress: session ? session.progress : []
-            });
-
-        } catch (error) {
-            console.error(`Error during payment extraction for session ${sessionId}:`, error);
-            const endTime = new Date().toISOString();
-            
-            const session = activeSessions.get(sessionId);
-            if (session) {
-                session.status = 'error';
-                session.error = error.message;
-                session.end_time = endTime;
-            }
-            
-            const errorMessage = `Error: ${error.message}`;
-            if (activeSessions.get(sessionId)) {
-                activeSessions.get(sessionId).progress.push({
-                    message: errorMessage,
-                    timestamp: new Date().toISOString()
-                });
-            }
-            
-            if (io) {
-                io.emit('analysis_error', { session_id: sessionId, error: error.message });
-            }
-
-            // Return error response
-            res.status(500).json({
-                session_id: sessionId,
-                status: 'error',
-                message: 'Payment gateway extraction failed',
-                checkout_url: checkoutUrl,
-                start_time: startTime,
-                end_time: endTime,
-                error: error.message,
-                progress: session ? session.progress : []
+                end_time: session.end_time,
+                duration_seconds: Math.round((Date.parse(session.end_time) - Date.parse(startTime)) / 1000),
+                result: session.result,
+                progress: session.progress
             });
         }
 
+        // Return error response
+        res.status(500).json({
+            session_id: sessionId,
+            status: 'error',
+            message: 'Payment gateway extraction failed',
+            checkout_url: checkoutUrl,
+            start_time: startTime,
+            end_time: session.end_time,
+            error: session.error,
+            progress: session.progress
+        });
+
     } catch (error) {
         console.error('Error in direct payment API endpoint:', error);
         res.status(500).json({ error: 'Internal server error' });
@@ -630,21 +977,19 @@ app.get('/api/url/:encoded_url(*)', async (req, res) => {
             return res.status(400).json({ error: 'URL is required' });
         }
 
-        // Decode the URL parameter
-        const websiteUrl = decodeURIComponent(encoded_url.trim());
-        
-        // Validate URL format
-        try {
-            new URL(websiteUrl);
-        } catch (error) {
-            return res.status(400).json({ error: 'Invalid URL format' });
+        // Decode and validate the URL parameter
+        const websiteUrl = normalizeUrl(decodeURIComponent(encoded_url));
+        if (!websiteUrl) {
+            return res.status(400).json({ error: 'URL must be a valid http:// or https:// address' });
         }
 
-        const sessionId = uuidv4();
-        const startTime = new Date().toISOString();
+        if (rejectWhenBusy(res)) return;
+
+        const sessionId = newSessionId();
+        const startTime = isoNow();
 
         // Store session info
-        activeSessions.set(sessionId, {
+        storeSession(sessionId, {
             url: websiteUrl,
             status: 'running',
             start_time: startTime,
@@ -654,100 +999,49 @@ app.get('/api/url/:encoded_url(*)', async (req, res) => {
 
         console.log(`🚀 Starting SYNCHRONOUS direct API analysis for: ${websiteUrl}`);
         
-        try {
-            const extractor = new CheckoutURLExtractor(5); // 5 minute maximum timeout for French webshops with account creation
-            console.log("✅ CheckoutURLExtractor initialized successfully");
-            
+        // SYNCHRONOUS EXECUTION - Wait for completion
+        const session = await runAnalysis(sessionId, 'direct API analysis', async () => {
+            const extractor = getCheckoutExtractor();
+
             const progressCallback = new WebProgressCallback(sessionId);
-            
-            // Override the call method to store progress
-            progressCallback.call = (message) => {
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.progress.push({
-                        message: message,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-                if (io) {
-                    io.emit('progress_update', {
-                        session_id: sessionId,
-                        message: message,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-            };
 
             progressCallback.call(`Starting analysis for: ${websiteUrl}`);
-            
-            // SYNCHRONOUS EXECUTION - Wait for completion
-            const result = await extractor.extractCheckoutURLWithStreaming(websiteUrl, progressCallback.call.bind(progressCallback));
-            
-            const endTime = new Date().toISOString();
-            
-            // Update session with results
-            const session = activeSessions.get(sessionId);
-            if (session) {
-                session.result = result;
-                session.status = 'completed';
-                session.end_time = endTime;
-            }
-            
+            const result = await extractor.extractCheckoutURLWithStreaming(websiteUrl, progressCallback.call, {
+                refresh: req.query.refresh === '1'
+            });
             progressCallback.call("Analysis completed successfully!");
-            
-            if (io) {
-                io.emit('analysis_complete', { session_id: sessionId, result: result });
-            }
+            return result;
+        }, {
+            isDuplicate: () => checkoutResultShared(websiteUrl, { refresh: req.query.refresh === '1' })
+        });
 
+        if (session.status === 'completed') {
             // Return complete results immediately
-            res.json({
+            return res.json({
                 session_id: sessionId,
                 status: 'completed',
                 message: 'Analysis completed successfully',
                 url: websiteUrl,
                 start_time: startTime,
-                end_time: endTime,
-                duration_seconds: Math.round((new Date(endTime) - new Date(startTime)) / 1000),
-                result: result,
-                progress: session ? session.progress : []
-            });
-
-        } catch (error) {
-            console.error(`Error during direct API analysis for session ${sessionId}:`, error);
-            const endTime = new Date().toISOString();
-            
-            const session = activeSessions.get(sessionId);
-            if (session) {
-                session.status = 'error';
-                session.error = error.message;
-                session.end_time = endTime;
-            }
-            
-            const errorMessage = `Error: ${error.message}`;
-            if (activeSessions.get(sessionId)) {
-                activeSessions.get(sessionId).progress.push({
-                    message: errorMessage,
-                    timestamp: new Date().toISOString()
-                });
-            }
-            
-            if (io) {
-                io.emit('analysis_error', { session_id: sessionId, error: error.message });
-            }
-
-            // Return error response
-            res.status(500).json({
-                session_id: sessionId,
-                status: 'error',
-                message: 'Analysis failed',
-                url: websiteUrl,
-                start_time: startTime,
-                end_time: endTime,
-                error: error.message,
-                progress: session ? session.progress : []
+                end_time: session.end_time,
+                duration_seconds: Math.round((Date.parse(session.end_time) - Date.parse(startTime)) / 1000),
+                result: session.result,
+                progress: session.progress
             });
         }
 
+        // Return error response
+        res.status(500).json({
+            session_id: sessionId,
+            status: 'error',
+            message: 'Analysis failed',
+            url: websiteUrl,
+            start_time: startTime,
+            end_time: session.end_time,
+            error: session.error,
+            progress: session.progress
+        });
+
     } catch (error) {
         console.error('Error in direct API endpoint:', error);
         res.status(500).json({ error: 'Internal server error' });
@@ -763,80 +1057,47 @@ app.post('/api/france/shopify/analyze', async (req, res) => {
             return res.status(400).json({ error: 'URL is required' });
         }
 
-        const sessionId = uuidv4();
-        const websiteUrl = url.trim();
+        const websiteUrl = normalizeUrl(url);
+        if (!websiteUrl) {
+            return res.status(400).json({ error: 'URL must be a valid http:// or https:// address' });
+        }
+
+        if (rejectWhenBusy(res)) return;
+
+        const sessionId = newSessionId();
 
         // Store session info
-        activeSessions.set(sessionId, {
+        storeSession(sessionId, {
             url: websiteUrl,
             status: 'starting',
-            start_time: new Date().toISOString(),
+            start_time: isoNow(),
             progress: [],
             result: null
         });
 
-        // Ensure polling callers stop after hard timeout
-        scheduleSessionTimeout(sessionId, 4, 2000);
-
-        // Start analysis in background
-        setImmediate(async () => {
-            try {
-                console.log(`🇫🇷 Starting French Shopify checkout extraction for: ${websiteUrl}`);
-                
-                const extractor = new FranceShopifyCheckoutExtractor(4); // 4 minute timeout for Shopify
-                
-                const result = await extractor.extractCheckoutURLWithStreaming(websiteUrl, (message) => {
-                    const session = activeSessions.get(sessionId);
-                    if (session) {
-                        session.progress.push({
-                            message,
-                            timestamp: new Date().toISOString()
-                        });
-                        
-                        if (io) {
-                            io.emit('analysis_progress', { session_id: sessionId, message });
-                        }
-                    }
-                });
+        // Start analysis in background; polling callers are stopped by its hard timeout
+        runAnalysis(sessionId, 'French Shopify checkout extraction', async () => {
+            console.log(`🇫🇷 Starting French Shopify checkout extraction for: ${websiteUrl}`);
 
-                // Update session with result
-                const session = activeSessions.get(sessionId);
-                if (session) {
-                    session.status = 'completed';
-                    session.result = result;
-                    session.end_time = new Date().toISOString();
-                    session.progress.push({
-                        message: '✅ French Shopify checkout extraction completed!',
-                        timestamp: new Date().toISOString()
-                    });
-                }
-                
-                if (io) {
-                    io.emit('analysis_complete', { session_id: sessionId, result });
-                }
-
-            } catch (error) {
-                console.error('Error in French Shopify checkout extraction:', error);
-                
-                const session = activeSessions.get(sessionId);
-                const startTime = session ? session.start_time : new Date().toISOString();
-                const endTime = new Date().toISOString();
-                
-                if (session) {
-                    session.status = 'error';
-                    session.error = error.message;
-                    session.end_time = endTime;
-                    const errorMessage = `❌ French Shopify checkout extraction failed: ${error.message}`;
-                    session.progress.push({
-                        message: errorMessage,
-                        timestamp: new Date().toISOString()
-                    });
-                }
-                
-                if (io) {
-                    io.emit('analysis_error', { session_id: sessionId, error: error.message });
-                }
+            const extractor = getFranceShopifyExtractor();
+
+            const progressCallback = new WebProgressCallback(sessionId);
+            const result = await shareExtraction('france-shopify', websiteUrl, progressCallback.call,
+                () => extractor.extractCheckoutURLWithStreaming(websiteUrl, progressCallback.call));
+
+            const session = activeSessions.get(sessionId);
+            if (session) {
+                session.progress.push({
+                    message: '✅ French Shopify checkout extraction completed!',
+                    timestamp: isoNow()
+                });
             }
+
+            return result;
+        }, {
+            timeoutMinutes: 4,
+            isDuplicate: () => inFlightExtractions.has(extractionKey('france-shopify', websiteUrl)),
+            describeError: (error) => `❌ French Shopify checkout extraction failed: ${error.message}`
         });
 
         // Return session ID immediately
@@ -845,7 +1106,7 @@ app.post('/api/france/shopify/analyze', async (req, res) => {
             status: 'started',
             message: 'French Shopify checkout extraction started',
             url: websiteUrl,
-            start_time: new Date().toISOString()
+            start_time: isoNow()
         });
 
     } catch (error) {
@@ -864,6 +1125,22 @@ module.exports = app;
 
 // Start server locally (for development)
 if (require.main === module) {
+    // A long-running server loads the extractors once at boot so the first
+    // analysis doesn't pay for module loading and client setup; serverless
+    // invocations keep loading them on demand.
+    if (process.env.HYPERBROWSER_API_KEY) {
+        getCheckoutExtractor();
+        getPaymentExtractor();
+        getFranceShopifyExtractor();
+    }
+
+    // Let in-flight session stops reach Hyperbrowser before the process exits
+    process.once('SIGTERM', () => {
+        server.close();
+        const closing = checkoutExtractor ? checkoutExtractor.close() : Promise.resolve();
+        closing.finally(() => process.exit(0));
+    });
+
     const PORT = process.env.PORT || 3000;
     server.listen(PORT, () => {
         console.log(`🚀 Payment Provider Extractor running on port ${PORT}`);
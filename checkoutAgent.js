@@ -1,75 +1,22 @@
-const { Hyperbrowser } = require('@hyperbrowser/sdk');
-
-class CheckoutURLExtractor {
-    /**
-     * ULTRA-FAST Browser Use agent optimized for French e-commerce websites.
-     * Designed for maximum speed and effectiveness on French webshops.
-     */
-    
-    constructor(timeoutMinutes = 5) { // 5 minutes maximum timeout for French webshops with account creation
-        const apiKey = process.env.HYPERBROWSER_API_KEY;
-        if (!apiKey) {
-            console.error("❌ HYPERBROWSER_API_KEY environment variable is required but not found.");
-            throw new Error("HYPERBROWSER_API_KEY environment variable is required.");
-        }
-        
-        // Log the API key being used (first few characters for security)
-        console.log(`🔑 CheckoutURLExtractor initializing with Hyperbrowser API Key (first 5 chars): ${apiKey.substring(0, 5)}...`);
-        
-        try {
-            this.hb = new Hyperbrowser({ apiKey });
-            console.log("✅ Hyperbrowser client initialized successfully");
-        } catch (error) {
-            console.error("❌ Failed to initialize Hyperbrowser client:", error.message);
-            throw error;
-        }
-        
-        this.timeoutMinutes = timeoutMinutes;
-        console.log(`🔧 CheckoutURLExtractor initialized with timeout: ${this.timeoutMinutes} minutes`);
-    }
-
-    /**
-     * ULTRA-FAST checkout URL extraction using Browser Use for French webshops
-     */
-    async extractCheckoutURLWithStreaming(websiteUrl, progressCallback = null) {
-        try {
-            if (progressCallback) {
-                progressCallback("🚀 Starting ULTRA-FAST Browser Use checkout extraction...");
-            }
-
-            const taskDescription = this._getUltraFastTaskDescription(websiteUrl);
-            const sessionOptions = this._getOptimizedSessionOptions();
-
-            const result = await this._runBrowserUseTask(
-                taskDescription, 
-                sessionOptions, 
-                progressCallback
-            );
-
-            if (progressCallback) {
-                progressCallback("✅ ULTRA-FAST checkout extraction completed!");
-            }
-
-            return result;
-
-        } catch (error) {
-            if (progressCallback) {
-                progressCallback(`❌ Error during extraction: ${error.message}`);
-            }
-            throw error;
-        }
-    }
-
-    /**
-     * ULTRA-FAST task description optimized for French e-commerce sites
-     */
-    _getUltraFastTaskDescription(websiteUrl) {
-        return `
-🚀 ULTRA-FAST FRENCH E-COMMERCE CHECKOUT EXTRACTION 🚀
-
-MISSION: Go to ${websiteUrl} and IMMEDIATELY extract checkout URL and payment providers.
-
-🚨 CRITICAL FIRST STEP - POPUP DETECTION:
+const { getHyperbrowserClient, getFinalResult, stopSession, withTimeout } = require('./hyperbrowserClient');
+
+// Popup buttons the agent should click, by popup type. Rendered once into
+// STEP 1 of the task; the monitoring rules refer back to it rather than
+// repeating the lists, which keeps the prompt (and its token count) shorter.
+const POPUP_BUTTONS = {
+    'COOKIE BANNERS': ['Accepter', 'Accept', 'OK', "J'accepte", 'Autoriser', 'Allow', 'Tout accepter', 'Accepter tout'],
+    'NEWSLETTER POPUPS': ['No, thanks', 'Non merci', 'Fermer', 'Close', 'X', '✕', 'Pas maintenant', 'Plus tard', 'Non', 'No'],
+    'DISCOUNT POPUPS': ['Fermer', 'Close', 'X', '✕', 'Non merci', 'Continuer sans', 'No, thanks'],
+    'AGE VERIFICATION': ['Oui', 'Yes', "J'ai 18 ans", 'I am 18+', 'Entrer', 'Enter'],
+    'LOCATION POPUPS': ['France', 'FR', 'Continuer', 'Continue', 'OK']
+};
+const POPUP_BUTTON_LINES = Object.entries(POPUP_BUTTONS)
+    .map(([kind, labels]) => `   - ${kind}: Click ${labels.map(label => `"${label}"`).join(', ')}`)
+    .join('\n');
+
+// Everything in the checkout task prompt that doesn't depend on the website,
+// built once at load; only the mission and START lines are filled in per call
+const TASK_INSTRUCTIONS = `🚨 CRITICAL FIRST STEP - POPUP DETECTION:
 - IMMEDIATELY upon page load, scan for ANY popup/overlay
 - Look for: "10% OFF", "discount", "newsletter", "subscribe", "offer" popups
 - If popup detected, close it INSTANTLY:
@@ -89,11 +36,7 @@ MISSION: Go to ${websiteUrl} and IMMEDIATELY extract checkout URL and payment pr
 
 1. HANDLE ALL POPUPS & COOKIES (0.5 seconds):
    - CRITICAL: Look for ANY popup/overlay blocking the page
-   - COOKIE BANNERS: Click "Accepter", "Accept", "OK", "J'accepte", "Autoriser", "Allow", "Tout accepter", "Accepter tout"
-   - NEWSLETTER POPUPS: Click "No, thanks", "Non merci", "Fermer", "Close", "X", "✕", "Pas maintenant", "Plus tard", "Non", "No"
-   - DISCOUNT POPUPS: Click "Fermer", "Close", "X", "✕", "Non merci", "Continuer sans", "No, thanks"
-   - AGE VERIFICATION: Click "Oui", "Yes", "J'ai 18 ans", "I am 18+", "Entrer", "Enter"
-   - LOCATION POPUPS: Click "France", "FR", "Continuer", "Continue", "OK"
+${POPUP_BUTTON_LINES}
    - IMMEDIATE ACTIONS:
      * Press ESC key first
      * Click any "X", "✕", "Close", "Fermer" button
@@ -146,12 +89,7 @@ MISSION: Go to ${websiteUrl} and IMMEDIATELY extract checkout URL and payment pr
 
 🚨 CONTINUOUS POPUP MONITORING:
 - ALWAYS check for popups before each action
-- If ANY popup appears, close it immediately:
-  * Cookie banners: "Accepter", "Accept", "OK", "J'accepte", "Autoriser", "Allow"
-  * Newsletter: "No, thanks", "Non merci", "Fermer", "Close", "X", "✕", "Pas maintenant", "Non", "No"
-  * Discounts: "Fermer", "Close", "X", "✕", "Non merci", "Continuer sans", "No, thanks"
-  * Age verification: "Oui", "Yes", "J'ai 18 ans", "Entrer", "Enter"
-  * Location: "France", "FR", "Continuer", "Continue", "OK"
+- If ANY popup appears, close it immediately with the STEP 1 buttons for its type
 - CRITICAL: "10% OFF" or "discount" popups - click "No, thanks" or "X" immediately
 - Use ESC key if no close button visible
 - Click outside popup if needed
@@ -159,7 +97,7 @@ MISSION: Go to ${websiteUrl} and IMMEDIATELY extract checkout URL and payment pr
 - NEVER proceed with popups open - they will block all actions
 
 🎯 CRITICAL OUTPUT FORMAT (MANDATORY - COPY EXACTLY):
-WEBSITE_NAME: bonparfumeur.com
+WEBSITE_NAME: [website domain]
 PRODUCT_ADDED: [product name you added to cart]
 CHECKOUT_URL: [EXACT URL from address bar - COPY THIS EXACTLY]
 PAYMENT_PROVIDERS: [comma-separated list like: Visa, Mastercard, PayPal, Stripe]
@@ -171,10 +109,293 @@ ISSUES_ENCOUNTERED: [any problems or delays]
 - YOU MUST identify at least 3 payment providers if visible
 - YOU MUST extract the website name from the domain
 - YOU MUST provide the product name you added to cart
-- DO NOT leave any field as "Unknown" - find the actual values
+- DO NOT leave any field as "Unknown" - find the actual values`;
+
+// Structured "FIELD: value" lines in the agent's final output, matched in one pass
+const FIELD_LINE_RE = /^[ \t]*(CHECKOUT_URL|PAYMENT_PROVIDERS|PRODUCT_ADDED|WEBSITE_NAME|STEPS_COMPLETED|ISSUES_ENCOUNTERED|SCREENSHOT_READY):(.*)$/gm;
+
+// Fallback patterns for agent responses that skip the structured lines
+const URL_TOKEN_RE = /(https?:\/\/[^\s\]\)\">]+)/gmi;
+const LOGIN_URL_RE = /login|signin|signup|register|account\/login|account\/signup|auth/i;
+const CHECKOUT_URL_RE = /checkout|checkouts|cart|kasse|kassa|cassa|panier|koszyk|ko\u0161\u00edk|carrello|k\u00f8b/i;
+const DOMAIN_RE = /(?:https?:\/\/)?(?:www\.)?([a-zA-Z0-9-]+\.[a-zA-Z]{2,})/;
+// Provider names looked for in the response text, paired with their lowercase form
+const PAYMENT_KEYWORDS = [
+    'Visa', 'Mastercard', 'PayPal', 'Stripe', 'Adyen', 'Klarna', 'Afterpay',
+    'Shop Pay', 'Google Pay', 'Apple Pay', 'CB', 'Carte Bancaire', 'American Express',
+    'PayPlug', 'Lyra', 'Sofort', 'iDEAL', 'Bancontact', 'SEPA'
+].map(name => [name, name.toLowerCase()]);
+const PRODUCT_KEYWORDS = ['product', 'item', 'perfume', 'fragrance', 'bottle', '602', 'pepper', 'cedar', 'patchouli'];
+
+// Successful extractions are reused for this long, so retries and dashboard
+// refreshes of the same site don't start another browser session
+const RESULT_CACHE_TTL_MS = (parseFloat(process.env.RESULT_CACHE_TTL_MINUTES) || 60) * 60 * 1000;
+const RESULT_CACHE_MAX_ENTRIES = 500;
+
+// A running agent task's status is polled every TASK_POLL_INTERVAL_MS. Its
+// full step list, which grows as the agent works, is only downloaded every
+// TASK_REPORT_CHECK_POLLS polls to look for an early checkout report. As with
+// the SDK's own startAndWait, a run survives transient poll failures and only
+// fails after TASK_POLL_MAX_ERRORS in a row.
+const TASK_POLL_INTERVAL_MS = 2000;
+const TASK_REPORT_CHECK_POLLS = 5;
+const TASK_POLL_MAX_ERRORS = 5;
+const TERMINAL_TASK_STATUSES = new Set(['completed', 'failed', 'stopped']);
+const CHECKOUT_REPORT_RE = /CHECKOUT_URL:\s*https?:\/\//;
+
+/**
+ * Wrap a progress callback so messages are delivered in order on a later turn
+ * of the event loop instead of inline with the extraction. A callback that
+ * throws is logged and skipped rather than failing the extraction. Call
+ * flush() before handing back a result so no message arrives after it.
+ */
+function deferredProgress(progressCallback) {
+    if (!progressCallback) {
+        return null;
+    }
+
+    const queue = [];
+    const flush = () => {
+        // Messages queued by the callback itself are picked up by this same loop
+        for (let i = 0; i < queue.length; i++) {
+            try {
+                progressCallback(queue[i]);
+            } catch (error) {
+                console.warn(`⚠️ Progress callback failed: ${error.message}`);
+            }
+        }
+        queue.length = 0;
+    };
+
+    const report = (message) => {
+        if (queue.push(message) === 1) {
+            setImmediate(flush);
+        }
+    };
+    report.flush = flush;
+    return report;
+}
+
+class CheckoutURLExtractor {
+    /**
+     * ULTRA-FAST Browser Use agent optimized for French e-commerce websites.
+     * Designed for maximum speed and effectiveness on French webshops.
+     */
+    
+    constructor(timeoutMinutes = 5, maxConcurrentSessions = 3, keepRawResponse = false) { // 5 minutes maximum timeout for French webshops with account creation
+        this.hb = getHyperbrowserClient();
+        
+        this.timeoutMinutes = timeoutMinutes;
+        // Copy the agent's full response text onto results as raw_response;
+        // debugging only, as it is most of a result's size
+        this.keepRawResponse = keepRawResponse;
+        // Upper bound for parallel browser sessions in batch runs; keep it within
+        // the Hyperbrowser account's concurrent session quota
+        this.maxConcurrentSessions = maxConcurrentSessions;
+        // Normalized URL -> { time, result } for recent successes, and
+        // normalized URL -> pending promise for extractions still running
+        this.resultCache = new Map();
+        this.inFlight = new Map();
+        // Session stops issued after a successful run, see close()
+        this.pendingStops = new Set();
+        console.log(`🔧 CheckoutURLExtractor initialized with timeout: ${this.timeoutMinutes} minutes`);
+    }
+
+    /**
+     * Extract checkout URLs for several websites through the shared Hyperbrowser
+     * client, running at most `concurrency` browser sessions at a time.
+     * Progress messages are prefixed with the website they belong to; the
+     * per-site live-view screenshot lookup is skipped.
+     * @returns {Promise<Array<{url: string, result?: object, error?: string}>>} One entry per URL, in input order.
+     */
+    async extractCheckoutURLsBatch(websiteUrls, progressCallback = null, concurrency = this.maxConcurrentSessions) {
+        const results = new Array(websiteUrls.length);
+        let nextIndex = 0;
+
+        const worker = async () => {
+            while (nextIndex < websiteUrls.length) {
+                const index = nextIndex++;
+                const websiteUrl = websiteUrls[index];
+                const urlProgress = progressCallback
+                    ? (message) => progressCallback(`[${websiteUrl}] ${message}`)
+                    : null;
+
+                try {
+                    const result = await this.extractCheckoutURLWithStreaming(websiteUrl, urlProgress, { captureScreenshot: false });
+                    results[index] = { url: websiteUrl, result };
+                } catch (error) {
+                    results[index] = { url: websiteUrl, error: error.message };
+                }
+            }
+        };
+
+        const workerCount = Math.max(1, Math.min(concurrency, websiteUrls.length));
+        await Promise.all(Array.from({ length: workerCount }, worker));
+        return results;
+    }
+
+    /**
+     * ULTRA-FAST checkout URL extraction using Browser Use for French webshops.
+     * Recent successful results for the same site are served from cache, and a
+     * request for a site that is already being analyzed waits for that run.
+     * Progress messages are delivered asynchronously (see deferredProgress),
+     * all of them before the returned promise settles.
+     * Pass `{ captureScreenshot: false }` to skip the live-view lookup when the
+     * caller has no use for the screenshot field, and `{ refresh: true }` to
+     * ignore a cached result and extract again.
+     */
+    async extractCheckoutURLWithStreaming(websiteUrl, progressCallback = null, { captureScreenshot = true, refresh = false } = {}) {
+        const report = deferredProgress(progressCallback);
+        try {
+            return await this._extractCheckoutURLCached(websiteUrl, report, captureScreenshot, refresh);
+        } finally {
+            if (report) {
+                report.flush();
+            }
+        }
+    }
+
+    /**
+     * Whether extractCheckoutURLWithStreaming with these options would be
+     * answered from the cache or an in-flight run instead of opening a
+     * browser session of its own
+     */
+    wouldReuseResult(websiteUrl, { captureScreenshot = true, refresh = false } = {}) {
+        const cacheKey = this._cacheKey(websiteUrl);
+        return Boolean((!refresh && this._cachedResult(cacheKey, captureScreenshot))
+            || this._pendingExtraction(cacheKey, captureScreenshot));
+    }
+
+    /**
+     * Cache and in-flight lookup in front of _extractCheckoutURL. A result
+     * from a run without a screenshot is only reused by callers that don't
+     * want one either.
+     */
+    async _extractCheckoutURLCached(websiteUrl, progressCallback, captureScreenshot, refresh) {
+        const cacheKey = this._cacheKey(websiteUrl);
+
+        const cached = refresh ? null : this._cachedResult(cacheKey, captureScreenshot);
+        if (cached) {
+            if (progressCallback) {
+                progressCallback("♻️ Using cached checkout extraction result for this website");
+            }
+            return { ...cached.result };
+        }
+
+        const pending = this._pendingExtraction(cacheKey, captureScreenshot);
+        if (pending) {
+            if (progressCallback) {
+                progressCallback("⏳ This website is already being analyzed, waiting for that result...");
+            }
+            return { ...(await pending) };
+        }
+
+        const inFlightKey = this._inFlightKey(cacheKey, captureScreenshot);
+        const extraction = this._extractCheckoutURL(websiteUrl, progressCallback, captureScreenshot);
+        this.inFlight.set(inFlightKey, extraction);
+        try {
+            const result = await extraction;
+            if (result && result.checkout_url) {
+                this._cacheResult(cacheKey, result, captureScreenshot);
+            }
+            return result;
+        } finally {
+            this.inFlight.delete(inFlightKey);
+        }
+    }
+
+    /**
+     * The fresh cache entry for a website that suits the caller, or null
+     */
+    _cachedResult(cacheKey, captureScreenshot) {
+        const cached = this.resultCache.get(cacheKey);
+        if (!cached || Date.now() - cached.time >= RESULT_CACHE_TTL_MS) {
+            return null;
+        }
+        return cached.withScreenshot || !captureScreenshot ? cached : null;
+    }
+
+    /**
+     * An in-flight run for a website that suits the caller, or undefined.
+     * Runs with and without a screenshot are tracked under separate keys.
+     */
+    _pendingExtraction(cacheKey, captureScreenshot) {
+        return this.inFlight.get(this._inFlightKey(cacheKey, true))
+            || (captureScreenshot ? undefined : this.inFlight.get(this._inFlightKey(cacheKey, false)));
+    }
 
-🚀 START NOW: ${websiteUrl}
-        `.trim();
+    _inFlightKey(cacheKey, captureScreenshot) {
+        return captureScreenshot ? `${cacheKey} +screenshot` : cacheKey;
+    }
+
+    /**
+     * Cache key for a website: lowercase host, no fragment, no trailing slash
+     */
+    _cacheKey(websiteUrl) {
+        try {
+            const url = new URL(websiteUrl);
+            url.hash = '';
+            return url.toString().replace(/\/+$/, '');
+        } catch (error) {
+            return String(websiteUrl).trim().toLowerCase().replace(/\/+$/, '');
+        }
+    }
+
+    /**
+     * Remember a successful result, dropping the oldest entry when the cache is full
+     */
+    _cacheResult(cacheKey, result, withScreenshot) {
+        this.resultCache.delete(cacheKey);
+        if (this.resultCache.size >= RESULT_CACHE_MAX_ENTRIES) {
+            this.resultCache.delete(this.resultCache.keys().next().value);
+        }
+        this.resultCache.set(cacheKey, { time: Date.now(), withScreenshot, result: { ...result } });
+    }
+
+    /**
+     * Run one uncached checkout extraction in a fresh browser session
+     */
+    async _extractCheckoutURL(websiteUrl, progressCallback = null, captureScreenshot = true) {
+        try {
+            if (progressCallback) {
+                progressCallback("🚀 Starting ULTRA-FAST Browser Use checkout extraction...");
+            }
+
+            const taskDescription = this._getUltraFastTaskDescription(websiteUrl);
+            const sessionOptions = this._getOptimizedSessionOptions();
+
+            const result = await this._runBrowserUseTask(
+                taskDescription, 
+                sessionOptions, 
+                progressCallback,
+                captureScreenshot
+            );
+
+            if (progressCallback) {
+                progressCallback("✅ ULTRA-FAST checkout extraction completed!");
+            }
+
+            return result;
+
+        } catch (error) {
+            if (progressCallback) {
+                progressCallback(`❌ Error during extraction: ${error.message}`);
+            }
+            throw error;
+        }
+    }
+
+    /**
+     * ULTRA-FAST task description optimized for French e-commerce sites
+     */
+    _getUltraFastTaskDescription(websiteUrl) {
+        return `🚀 ULTRA-FAST FRENCH E-COMMERCE CHECKOUT EXTRACTION 🚀
+
+MISSION: Go to ${websiteUrl} and IMMEDIATELY extract checkout URL and payment providers.
+
+${TASK_INSTRUCTIONS}
+
+🚀 START NOW: ${websiteUrl}`;
     }
 
 
@@ -219,9 +440,8 @@ ISSUES_ENCOUNTERED: [any problems or delays]
     /**
      * ULTRA-FAST Browser Use task runner optimized for French webshops
      */
-    async _runBrowserUseTask(taskDescription, sessionOptions, progressCallback = null) {
+    async _runBrowserUseTask(taskDescription, sessionOptions, progressCallback = null, captureScreenshot = true) {
         let sessionId = null;
-        let timeoutId = null;
 
         try {
             if (progressCallback) {
@@ -236,34 +456,14 @@ ISSUES_ENCOUNTERED: [any problems or delays]
                 progressCallback(`📱 Browser session created: ${sessionId}`);
             }
 
-            // Set up timeout with session termination
-            const timeoutMs = this.timeoutMinutes * 60 * 1000;
-            const timeoutPromise = new Promise((_, reject) => {
-                timeoutId = setTimeout(async () => {
-                    try {
-                        if (sessionId) {
-                            await this.hb.sessions.stop(sessionId);
-                            if (progressCallback) {
-                                progressCallback(`🛑 Session ${sessionId} stopped due to timeout`);
-                            }
-                        }
-                    } catch (stopError) {
-                        if (progressCallback) {
-                            progressCallback(`⚠️ Warning: Could not stop session after timeout: ${stopError.message}`);
-                        }
-                    }
-                    reject(new Error(`Task timed out after ${this.timeoutMinutes} minutes`));
-                }, timeoutMs);
-            });
-
             if (progressCallback) {
                 progressCallback("🚀 Starting ULTRA-FAST Browser Use task...");
                 progressCallback("⚡ Optimized for maximum speed on French webshops");
                 progressCallback(`⏰ Timeout protection: ${this.timeoutMinutes} minutes maximum`);
             }
 
-            // ULTRA-FAST Browser Use task with optimized parameters
-            const browserUsePromise = this.hb.agents.browserUse.startAndWait({
+            // ULTRA-FAST Browser Use task with optimized parameters, run with timeout protection
+            const result = await withTimeout(signal => this._startAndMonitor({
                 task: taskDescription,
                 sessionId: sessionId,
                 // Use fastest available models
@@ -282,29 +482,22 @@ ISSUES_ENCOUNTERED: [any problems or delays]
                 useCustomApiKeys: true,
                 apiKeys: { openai: process.env.OPENAI_API_KEY },
                 keepBrowserOpen: false // Close after completion
-            });
-
-            // Execute the task with timeout protection
-            const result = await Promise.race([browserUsePromise, timeoutPromise]);
-
-            // Clear timeout since we completed successfully
-            if (timeoutId) {
-                clearTimeout(timeoutId);
-            }
+            }, progressCallback, signal), this.timeoutMinutes);
 
             if (progressCallback) {
                 progressCallback("✅ ULTRA-FAST Browser Use task completed!");
             }
 
             // Capture screenshot before stopping the session
-            const screenshotData = await this._captureCheckoutScreenshot(sessionId, progressCallback);
+            const screenshotData = captureScreenshot
+                ? await this._captureCheckoutScreenshot(sessionId, progressCallback, session)
+                : null;
 
             // Parse the agent response
+            const finalResult = getFinalResult(result);
             let parsedResult = {};
-            if (result && result.data && result.data.finalResult) {
-                parsedResult = this._parseAgentResponse(result.data.finalResult);
-            } else if (result && result.finalResult) {
-                parsedResult = this._parseAgentResponse(result.finalResult);
+            if (finalResult) {
+                parsedResult = this._parseAgentResponse(finalResult);
             } else {
                 // Fallback if no structured response
                 parsedResult = {
@@ -323,55 +516,148 @@ ISSUES_ENCOUNTERED: [any problems or delays]
                 parsedResult.screenshot = screenshotData;
             }
 
-            // Stop the session since we're done
-            try {
-                await this.hb.sessions.stop(sessionId);
-                if (progressCallback) {
-                    progressCallback("🛑 Browser session stopped successfully");
-                }
-            } catch (stopError) {
-                if (progressCallback) {
-                    progressCallback(`⚠️ Warning: Could not stop session cleanly: ${stopError.message}`);
-                }
+            // Stop the session since we're done, without making the caller wait for it
+            this._stopSessionInBackground(sessionId);
+            if (progressCallback) {
+                progressCallback("🛑 Releasing browser session");
             }
 
             return parsedResult;
 
         } catch (error) {
-            // Clear timeout if it exists
-            if (timeoutId) {
-                clearTimeout(timeoutId);
-            }
-
             // Stop the session if it was created
             if (sessionId) {
+                await stopSession(this.hb, sessionId, progressCallback, error.timedOut ? 'timeout' : 'error');
+            }
+
+            throw error;
+        }
+    }
+
+    /**
+     * Run a Browser Use task, returning early once the agent has written out
+     * the CHECKOUT_URL and PAYMENT_PROVIDERS lines in a step, instead of
+     * waiting for it to finish narrating the remaining steps. Aborting
+     * `signal` stops polling and the agent job. Falls back to startAndWait
+     * when the SDK has no start/get pair.
+     */
+    async _startAndMonitor(taskParams, progressCallback = null, signal = null) {
+        const browserUse = this.hb.agents.browserUse;
+        if (['start', 'getStatus', 'get'].some(method => typeof browserUse[method] !== 'function')) {
+            return browserUse.startAndWait(taskParams);
+        }
+
+        const { jobId } = await browserUse.start(taskParams);
+
+        // Polling ends as soon as the caller gives up on the task (timeout)
+        let polls = 0;
+        let pollErrors = 0;
+        while (!(signal && signal.aborted)) {
+            await new Promise(resolve => setTimeout(resolve, TASK_POLL_INTERVAL_MS));
+            if (signal && signal.aborted) {
+                break;
+            }
+
+            let task = null;
+            try {
+                const { status } = await browserUse.getStatus(jobId);
+                if (TERMINAL_TASK_STATUSES.has(status)) {
+                    return await browserUse.get(jobId);
+                }
+                polls++;
+                if (polls % TASK_REPORT_CHECK_POLLS === 0) {
+                    task = await browserUse.get(jobId);
+                }
+                pollErrors = 0;
+            } catch (pollError) {
+                pollErrors++;
+                if (pollErrors >= TASK_POLL_MAX_ERRORS) {
+                    throw pollError;
+                }
+                continue;
+            }
+
+            const report = task && this._findCheckoutReport(task.data && task.data.steps);
+            if (report) {
+                if (progressCallback) {
+                    progressCallback("🏁 Agent reported the checkout details, stopping the task early");
+                }
                 try {
-                    await this.hb.sessions.stop(sessionId);
-                    if (progressCallback) {
-                        progressCallback("🛑 Browser session stopped due to error");
-                    }
+                    await browserUse.stop(jobId);
                 } catch (stopError) {
-                    if (progressCallback) {
-                        progressCallback(`⚠️ Warning: Could not stop session after error: ${stopError.message}`);
-                    }
+                    // The session is stopped anyway once the result is handled
                 }
+                return { ...task, data: { ...task.data, finalResult: report } };
             }
+        }
 
-            throw error;
+        // Abandoned: stop the agent job too rather than leaving it running
+        try {
+            await browserUse.stop(jobId);
+        } catch (stopError) {
+            // The session stop on the timeout path ends the job anyway
         }
+        throw signal.reason;
     }
 
     /**
-     * Capture a screenshot of the current page using the session's live view
+     * The agent's output from its latest step, if it carries the structured
+     * CHECKOUT_URL and PAYMENT_PROVIDERS lines, or null. Only the `done`
+     * action's text and the step's extracted content count; memory, plans and
+     * evaluations may quote a draft of the report that is not final.
      */
-    async _captureCheckoutScreenshot(sessionId, progressCallback = null) {
+    _findCheckoutReport(steps) {
+        if (!Array.isArray(steps) || steps.length === 0) {
+            return null;
+        }
+
+        const step = steps[steps.length - 1] || {};
+        const actions = step.model_output && Array.isArray(step.model_output.action) ? step.model_output.action : [];
+        const results = Array.isArray(step.result) ? step.result : [];
+        const outputs = [
+            ...actions.map(action => action && action.done && action.done.text),
+            ...results.map(result => result && result.extracted_content)
+        ];
+        return outputs.find(text => typeof text === 'string'
+            && CHECKOUT_REPORT_RE.test(text)
+            && text.includes('PAYMENT_PROVIDERS:')) || null;
+    }
+
+    /**
+     * Stop a finished session without awaiting it. The request is tracked so
+     * close() can wait for outstanding stops before the process exits.
+     */
+    _stopSessionInBackground(sessionId) {
+        const stop = this.hb.sessions.stop(sessionId)
+            .catch(stopError => {
+                console.warn(`⚠️ Warning: Could not stop session ${sessionId} cleanly: ${stopError.message}`);
+            })
+            .finally(() => this.pendingStops.delete(stop));
+        this.pendingStops.add(stop);
+    }
+
+    /**
+     * Wait for background session stops to finish
+     */
+    async close() {
+        await Promise.allSettled([...this.pendingStops]);
+    }
+
+    /**
+     * Capture a screenshot of the current page using the session's live view.
+     * The live URL from the session-create response is used when present, so
+     * the extra sessions.get round-trip is only a fallback.
+     */
+    async _captureCheckoutScreenshot(sessionId, progressCallback = null, createdSession = null) {
         try {
             if (progressCallback) {
                 progressCallback("📸 Capturing checkout page screenshot...");
             }
 
             // Get session details to access the live URL
-            const sessionDetails = await this.hb.sessions.get(sessionId);
+            const sessionDetails = createdSession && (createdSession.liveUrl || createdSession.live_url)
+                ? createdSession
+                : await this.hb.sessions.get(sessionId);
 
             if (!sessionDetails) {
                 if (progressCallback) {
@@ -421,44 +707,28 @@ ISSUES_ENCOUNTERED: [any problems or delays]
         }
 
         const result = {};
-        const lines = responseText.trim().split('\n');
+        // Lowercased once and shared by the keyword fallbacks below
+        const responseLower = responseText.toLowerCase();
 
         // Parse structured format first
-        for (const line of lines) {
-            const trimmedLine = line.trim();
-            if (trimmedLine.startsWith('CHECKOUT_URL:')) {
-                result.checkout_url = trimmedLine.replace('CHECKOUT_URL:', '').trim();
-            } else if (trimmedLine.startsWith('PAYMENT_PROVIDERS:')) {
-                const providersText = trimmedLine.replace('PAYMENT_PROVIDERS:', '').trim();
-                result.payment_providers = providersText.split(',').map(p => p.trim()).filter(p => p);
-            } else if (trimmedLine.startsWith('PRODUCT_ADDED:')) {
-                result.product_added = trimmedLine.replace('PRODUCT_ADDED:', '').trim();
-            } else if (trimmedLine.startsWith('WEBSITE_NAME:')) {
-                result.website_name = trimmedLine.replace('WEBSITE_NAME:', '').trim();
-            } else if (trimmedLine.startsWith('STEPS_COMPLETED:')) {
-                result.steps_completed = trimmedLine.replace('STEPS_COMPLETED:', '').trim();
-            } else if (trimmedLine.startsWith('ISSUES_ENCOUNTERED:')) {
-                result.issues_encountered = trimmedLine.replace('ISSUES_ENCOUNTERED:', '').trim();
-            } else if (trimmedLine.startsWith('SCREENSHOT_READY:')) {
-                result.screenshot_ready = trimmedLine.replace('SCREENSHOT_READY:', '').trim();
-            }
+        for (const [, field, value] of responseText.matchAll(FIELD_LINE_RE)) {
+            result[field.toLowerCase()] = value.trim();
+        }
+        if (result.payment_providers !== undefined) {
+            result.payment_providers = result.payment_providers.split(',').map(p => p.trim()).filter(p => p);
         }
 
         // Enhanced URL extraction with multiple fallback methods
         if (!result.checkout_url || !/^https?:\/\//i.test(result.checkout_url)) {
             try {
                 // Method 1: Look for URLs in the response
-                const urlRegex = /(https?:\/\/[^\s\]\)\">]+)/gmi;
-                const matches = [...responseText.matchAll(urlRegex)].map(m => (m[1] || '').trim());
+                const matches = [...responseText.matchAll(URL_TOKEN_RE)].map(m => (m[1] || '').trim());
                 const unique = Array.from(new Set(matches));
                 
-                // Filter out login/signup/account URLs
-                const isLoginUrl = (u) => /login|signin|signup|register|account\/login|account\/signup|auth/i.test(u);
-                const looksLikeCheckout = (u) => /checkout|checkouts|cart|kasse|kassa|cassa|panier|koszyk|ko\u0161\u00edk|carrello|k\u00f8b/i.test(u);
-                
-                // Prefer URLs that look like checkout and are NOT login pages
-                const checkoutUrls = unique.filter(u => looksLikeCheckout(u) && !isLoginUrl(u));
-                const preferred = checkoutUrls[0] || unique.find(u => !isLoginUrl(u)) || unique[0];
+                // Prefer URLs that look like checkout and are NOT login/signup/account pages
+                const preferred = unique.find(u => CHECKOUT_URL_RE.test(u) && !LOGIN_URL_RE.test(u))
+                    || unique.find(u => !LOGIN_URL_RE.test(u))
+                    || unique[0];
                 
                 if (preferred) {
                     result.checkout_url = preferred;
@@ -469,17 +739,10 @@ ISSUES_ENCOUNTERED: [any problems or delays]
         // Enhanced payment provider extraction
         if (!result.payment_providers || result.payment_providers.length === 0) {
             try {
-                const paymentKeywords = [
-                    'Visa', 'Mastercard', 'PayPal', 'Stripe', 'Adyen', 'Klarna', 'Afterpay',
-                    'Shop Pay', 'Google Pay', 'Apple Pay', 'CB', 'Carte Bancaire', 'American Express',
-                    'PayPlug', 'Lyra', 'Sofort', 'iDEAL', 'Bancontact', 'SEPA'
-                ];
-                
                 const foundProviders = [];
-                const responseLower = responseText.toLowerCase();
                 
-                for (const provider of paymentKeywords) {
-                    if (responseLower.includes(provider.toLowerCase())) {
+                for (const [provider, providerLower] of PAYMENT_KEYWORDS) {
+                    if (responseLower.includes(providerLower)) {
                         foundProviders.push(provider);
                     }
                 }
@@ -499,10 +762,10 @@ ISSUES_ENCOUNTERED: [any problems or delays]
                     result.website_name = url.hostname.replace('www.', '');
                 } else {
                     // Look for domain patterns in the response
-                    const domainRegex = /(?:https?:\/\/)?(?:www\.)?([a-zA-Z0-9-]+\.[a-zA-Z]{2,})/g;
-                    const domainMatches = [...responseText.matchAll(domainRegex)];
-                    if (domainMatches.length > 0) {
-                        result.website_name = domainMatches[0][1];
+                    // Only the first match is used, so stop scanning there
+                    const domainMatch = DOMAIN_RE.exec(responseText);
+                    if (domainMatch) {
+                        result.website_name = domainMatch[1];
                     }
                 }
             } catch {}
@@ -512,27 +775,26 @@ ISSUES_ENCOUNTERED: [any problems or delays]
         if (!result.product_added || result.product_added === 'Unknown') {
             try {
                 // Look for product-related keywords in the response
-                const productKeywords = ['product', 'item', 'perfume', 'fragrance', 'bottle', '602', 'pepper', 'cedar', 'patchouli'];
-                const responseLower = responseText.toLowerCase();
+                // Split and lowercase the candidate lines once, not once per keyword
+                const lines = responseText.split('\n').filter(line => line.length > 5 && line.length < 100);
+                const linesLower = lines.map(line => line.toLowerCase());
                 
-                for (const keyword of productKeywords) {
+                for (const keyword of PRODUCT_KEYWORDS) {
                     if (responseLower.includes(keyword)) {
                         // Try to extract the product name from context
-                        const lines = responseText.split('\n');
-                        for (const line of lines) {
-                            if (line.toLowerCase().includes(keyword) && line.length > 5 && line.length < 100) {
-                                result.product_added = line.trim();
-                                break;
-                            }
+                        const index = linesLower.findIndex(line => line.includes(keyword));
+                        if (index !== -1) {
+                            result.product_added = lines[index].trim();
+                            break;
                         }
-                        if (result.product_added) break;
                     }
                 }
             } catch {}
         }
 
-        // Store the raw response for debugging
-        result.raw_response = responseText;
+        if (this.keepRawResponse) {
+            result.raw_response = responseText;
+        }
 
         return result;
     }
@@ -1,4 +1,39 @@
-const { Hyperbrowser } = require('@hyperbrowser/sdk');
+const { getHyperbrowserClient, getFinalResult, parseFieldLines, stopSession, withTimeout } = require('./hyperbrowserClient');
+
+// Everything in the Shopify task prompt that doesn't depend on the website,
+// built once at load; only the goal and START lines are filled in per call
+const TASK_INSTRUCTIONS = `STEP 1 - CLOSE POPUPS:
+- Press ESC key immediately
+- Click "X", "Close", "Fermer", "No thanks", "Non merci"
+- Click outside popup area
+- DO NOT proceed until popup is gone
+
+STEP 2 - ADD PRODUCT TO CART:
+- Find any product and click it
+- Click "Add to cart", "AJOUTER AU PANIER", "Acheter"
+- Keep quantity at 1
+
+STEP 3 - GO TO CHECKOUT:
+- Click "Checkout", "Panier", "Commander", cart icon
+- Copy the EXACT URL from address bar
+
+STEP 4 - EXTRACT DATA:
+- Look for payment providers: Shopify Payments, Shop Pay, PayPal, Visa, Mastercard
+- Extract the EXACT CHECKOUT URL from the address bar
+- Scroll to see all payment options
+
+OUTPUT FORMAT:
+WEBSITE_NAME: [domain]
+PRODUCT_ADDED: [product name]
+CHECKOUT_URL: [exact URL from address bar]
+PAYMENT_PROVIDERS: [comma-separated list]
+STEPS_COMPLETED: [what you did]
+ISSUES_ENCOUNTERED: [any problems]`;
+
+// Fields TASK_INSTRUCTIONS asks the agent to report
+const RESPONSE_FIELDS = new Set([
+    'CHECKOUT_URL', 'PAYMENT_PROVIDERS', 'PRODUCT_ADDED', 'WEBSITE_NAME', 'STEPS_COMPLETED', 'ISSUES_ENCOUNTERED'
+]);
 
 class FranceShopifyCheckoutExtractor {
     /**
@@ -7,25 +42,11 @@ class FranceShopifyCheckoutExtractor {
      * No account creation functionality.
      */
     
-    constructor(timeoutMinutes = 4) { // 4 minutes for Shopify checkout
-        const apiKey = process.env.HYPERBROWSER_API_KEY;
-        if (!apiKey) {
-            console.error("❌ HYPERBROWSER_API_KEY environment variable is required but not found.");
-            throw new Error("HYPERBROWSER_API_KEY environment variable is required.");
-        }
-        
-        // Log the API key being used (first few characters for security)
-        console.log(`🔑 FranceShopifyCheckoutExtractor initializing with Hyperbrowser API Key (first 5 chars): ${apiKey.substring(0, 5)}...`);
-        
-        try {
-            this.hb = new Hyperbrowser({ apiKey });
-            console.log("✅ Hyperbrowser client initialized successfully");
-        } catch (error) {
-            console.error("❌ Failed to initialize Hyperbrowser client:", error.message);
-            throw error;
-        }
+    constructor(timeoutMinutes = 4, keepRawResponse = false) { // 4 minutes for Shopify checkout
+        this.hb = getHyperbrowserClient();
         
         this.timeoutMinutes = timeoutMinutes;
+        this.keepRawResponse = keepRawResponse;
         console.log(`🔧 FranceShopifyCheckoutExtractor initialized with timeout: ${this.timeoutMinutes} minutes`);
     }
 
@@ -65,41 +86,13 @@ class FranceShopifyCheckoutExtractor {
      * Task description optimized for French Shopify webshops
      */
     _getFrenchShopifyTaskDescription(websiteUrl) {
-        return `
-🇫🇷 FRENCH SHOPIFY MISSION 🇫🇷
+        return `🇫🇷 FRENCH SHOPIFY MISSION 🇫🇷
 
 GOAL: Add product to cart, go to checkout, Extract checkout URL and payment providers from ${websiteUrl}
 
-STEP 1 - CLOSE POPUPS:
-- Press ESC key immediately
-- Click "X", "Close", "Fermer", "No thanks", "Non merci"
-- Click outside popup area
-- DO NOT proceed until popup is gone
+${TASK_INSTRUCTIONS}
 
-STEP 2 - ADD PRODUCT TO CART:
-- Find any product and click it
-- Click "Add to cart", "AJOUTER AU PANIER", "Acheter"
-- Keep quantity at 1
-
-STEP 3 - GO TO CHECKOUT:
-- Click "Checkout", "Panier", "Commander", cart icon
-- Copy the EXACT URL from address bar
-
-STEP 4 - EXTRACT DATA:
-- Look for payment providers: Shopify Payments, Shop Pay, PayPal, Visa, Mastercard
-- Extract the EXACT CHECKOUT URL from the address bar
-- Scroll to see all payment options
-
-OUTPUT FORMAT:
-WEBSITE_NAME: [domain]
-PRODUCT_ADDED: [product name]
-CHECKOUT_URL: [exact URL from address bar]
-PAYMENT_PROVIDERS: [comma-separated list]
-STEPS_COMPLETED: [what you did]
-ISSUES_ENCOUNTERED: [any problems]
-
-START: ${websiteUrl}
-        `.trim();
+START: ${websiteUrl}`;
     }
 
     /**
@@ -141,7 +134,7 @@ START: ${websiteUrl}
      */
     async _runShopifyTask(taskDescription, sessionOptions, progressCallback = null) {
         let sessionId = null;
-        let timeoutId = null;
+        let stopReason = 'error';
 
         try {
             if (progressCallback) {
@@ -156,26 +149,6 @@ START: ${websiteUrl}
                 progressCallback(`📱 Browser session created: ${sessionId}`);
             }
 
-            // Set up timeout with session termination
-            const timeoutMs = this.timeoutMinutes * 60 * 1000;
-            const timeoutPromise = new Promise((_, reject) => {
-                timeoutId = setTimeout(async () => {
-                    try {
-                        if (sessionId) {
-                            await this.hb.sessions.stop(sessionId);
-                            if (progressCallback) {
-                                progressCallback(`🛑 Session ${sessionId} stopped due to timeout`);
-                            }
-                        }
-                    } catch (stopError) {
-                        if (progressCallback) {
-                            progressCallback(`⚠️ Warning: Could not stop session after timeout: ${stopError.message}`);
-                        }
-                    }
-                    reject(new Error(`Task timed out after ${this.timeoutMinutes} minutes`));
-                }, timeoutMs);
-            });
-
             if (progressCallback) {
                 progressCallback("🚀 Starting French Shopify checkout task...");
                 progressCallback("⚡ Optimized for French Shopify stores");
@@ -206,23 +179,17 @@ START: ${websiteUrl}
             });
 
             // Execute the task with timeout protection
-            const result = await Promise.race([browserUsePromise, timeoutPromise]);
-
-            // Clear timeout since we completed successfully
-            if (timeoutId) {
-                clearTimeout(timeoutId);
-            }
+            const result = await withTimeout(() => browserUsePromise, this.timeoutMinutes);
 
             if (progressCallback) {
                 progressCallback("✅ French Shopify checkout task completed!");
             }
 
             // Parse the agent response
+            const finalResult = getFinalResult(result);
             let parsedResult = {};
-            if (result && result.data && result.data.finalResult) {
-                parsedResult = this._parseShopifyResponse(result.data.finalResult);
-            } else if (result && result.finalResult) {
-                parsedResult = this._parseShopifyResponse(result.finalResult);
+            if (finalResult) {
+                parsedResult = this._parseShopifyResponse(finalResult);
             } else {
                 // Fallback if no structured response
                 parsedResult = {
@@ -236,41 +203,19 @@ START: ${websiteUrl}
                 };
             }
 
-            // Stop the session since we're done
-            try {
-                await this.hb.sessions.stop(sessionId);
-                if (progressCallback) {
-                    progressCallback("🛑 Browser session stopped successfully");
-                }
-            } catch (stopError) {
-                if (progressCallback) {
-                    progressCallback(`⚠️ Warning: Could not stop session cleanly: ${stopError.message}`);
-                }
-            }
-
+            stopReason = 'done';
             return parsedResult;
 
         } catch (error) {
-            // Clear timeout if it exists
-            if (timeoutId) {
-                clearTimeout(timeoutId);
+            if (error.timedOut) {
+                stopReason = 'timeout';
             }
-
-            // Stop the session if it was created
+            throw error;
+        } finally {
+            // Stop the session if it was created, whichever way the task ended
             if (sessionId) {
-                try {
-                    await this.hb.sessions.stop(sessionId);
-                    if (progressCallback) {
-                        progressCallback("🛑 Browser session stopped due to error");
-                    }
-                } catch (stopError) {
-                    if (progressCallback) {
-                        progressCallback(`⚠️ Warning: Could not stop session after error: ${stopError.message}`);
-                    }
-                }
+                await stopSession(this.hb, sessionId, progressCallback, stopReason);
             }
-
-            throw error;
         }
     }
 
@@ -282,26 +227,10 @@ START: ${websiteUrl}
             return { error: 'No response from agent' };
         }
 
-        const result = {};
-        const lines = responseText.trim().split('\n');
-
         // Parse structured format first
-        for (const line of lines) {
-            const trimmedLine = line.trim();
-            if (trimmedLine.startsWith('CHECKOUT_URL:')) {
-                result.checkout_url = trimmedLine.replace('CHECKOUT_URL:', '').trim();
-            } else if (trimmedLine.startsWith('PAYMENT_PROVIDERS:')) {
-                const providersText = trimmedLine.replace('PAYMENT_PROVIDERS:', '').trim();
-                result.payment_providers = providersText.split(',').map(p => p.trim()).filter(p => p);
-            } else if (trimmedLine.startsWith('PRODUCT_ADDED:')) {
-                result.product_added = trimmedLine.replace('PRODUCT_ADDED:', '').trim();
-            } else if (trimmedLine.startsWith('WEBSITE_NAME:')) {
-                result.website_name = trimmedLine.replace('WEBSITE_NAME:', '').trim();
-            } else if (trimmedLine.startsWith('STEPS_COMPLETED:')) {
-                result.steps_completed = trimmedLine.replace('STEPS_COMPLETED:', '').trim();
-            } else if (trimmedLine.startsWith('ISSUES_ENCOUNTERED:')) {
-                result.issues_encountered = trimmedLine.replace('ISSUES_ENCOUNTERED:', '').trim();
-            }
+        const result = parseFieldLines(responseText, RESPONSE_FIELDS);
+        if (result.payment_providers !== undefined) {
+            result.payment_providers = result.payment_providers.split(',').map(p => p.trim()).filter(p => p);
         }
 
         // Enhanced URL extraction with Shopify-specific logic
@@ -374,25 +303,26 @@ START: ${websiteUrl}
                 // Look for product-related keywords in the response
                 const productKeywords = ['product', 'item', 'perfume', 'fragrance', 'bottle', 'shirt', 'dress', 'shoes'];
                 const responseLower = responseText.toLowerCase();
+                // Lowercase the candidate lines once, not once per keyword
+                const candidates = responseText.split('\n').filter(line => line.length > 5 && line.length < 100);
+                const candidatesLower = candidates.map(line => line.toLowerCase());
                 
                 for (const keyword of productKeywords) {
                     if (responseLower.includes(keyword)) {
                         // Try to extract the product name from context
-                        const lines = responseText.split('\n');
-                        for (const line of lines) {
-                            if (line.toLowerCase().includes(keyword) && line.length > 5 && line.length < 100) {
-                                result.product_added = line.trim();
-                                break;
-                            }
+                        const index = candidatesLower.findIndex(line => line.includes(keyword));
+                        if (index !== -1) {
+                            result.product_added = candidates[index].trim();
+                            break;
                         }
-                        if (result.product_added) break;
                     }
                 }
             } catch {}
         }
 
-        // Store the raw response for debugging
-        result.raw_response = responseText;
+        if (this.keepRawResponse) {
+            result.raw_response = responseText;
+        }
 
         return result;
     }
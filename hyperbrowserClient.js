@@ -0,0 +1,126 @@
+const { Hyperbrowser } = require('@hyperbrowser/sdk');
+
+let client = null;
+
+/**
+ * Shared Hyperbrowser client for all extractors.
+ * Created on first use so every extractor instance reuses the same client
+ * (and its HTTP connections) instead of building its own.
+ */
+function getHyperbrowserClient() {
+    if (client) {
+        return client;
+    }
+
+    const apiKey = process.env.HYPERBROWSER_API_KEY;
+    if (!apiKey) {
+        console.error("❌ HYPERBROWSER_API_KEY environment variable is required but not found.");
+        throw new Error("HYPERBROWSER_API_KEY environment variable is required.");
+    }
+
+    // Log the API key being used (first few characters for security)
+    console.log(`🔑 Initializing Hyperbrowser client with API Key (first 5 chars): ${apiKey.substring(0, 5)}...`);
+
+    try {
+        client = new Hyperbrowser({ apiKey });
+        console.log("✅ Hyperbrowser client initialized successfully");
+    } catch (error) {
+        console.error("❌ Failed to initialize Hyperbrowser client:", error.message);
+        throw error;
+    }
+
+    return client;
+}
+
+/**
+ * The agent's final output text from a browserUse.startAndWait response, or null.
+ * The SDK nests it under `data`; a bare `finalResult` is accepted as well.
+ */
+function getFinalResult(result) {
+    if (!result) {
+        return null;
+    }
+    return (result.data && result.data.finalResult) || result.finalResult || null;
+}
+
+/**
+ * Collect the structured "FIELD: value" lines from an agent's output. Each
+ * line whose field name is in the `fields` Set is stored under the lowercased
+ * field name, with the value trimmed.
+ */
+function parseFieldLines(text, fields) {
+    const result = {};
+    for (const line of text.split('\n')) {
+        const trimmedLine = line.trim();
+        const colon = trimmedLine.indexOf(':');
+        const field = colon === -1 ? null : trimmedLine.slice(0, colon);
+        if (fields.has(field)) {
+            result[field.toLowerCase()] = trimmedLine.slice(colon + 1).trim();
+        }
+    }
+    return result;
+}
+
+/**
+ * Run `task(signal)` with a time limit. When the limit is hit the signal is
+ * aborted and the returned promise rejects with an error flagged `timedOut`.
+ * The timer is always cleared, and a task that settles after losing the race
+ * is ignored instead of surfacing as an unhandled rejection.
+ */
+async function withTimeout(task, timeoutMinutes) {
+    const controller = new AbortController();
+    let timeoutId = null;
+    const timeoutPromise = new Promise((_, reject) => {
+        timeoutId = setTimeout(() => {
+            const error = new Error(`Task timed out after ${timeoutMinutes} minutes`);
+            error.timedOut = true;
+            controller.abort(error);
+            reject(error);
+        }, timeoutMinutes * 60 * 1000);
+    });
+
+    const running = Promise.resolve().then(() => task(controller.signal));
+    running.catch(() => {});
+
+    try {
+        return await Promise.race([running, timeoutPromise]);
+    } finally {
+        clearTimeout(timeoutId);
+    }
+}
+
+// Progress wording for stopSession, by why the session is being stopped
+const STOP_MESSAGES = {
+    done: {
+        stopped: () => "🛑 Browser session stopped successfully",
+        failed: "⚠️ Warning: Could not stop session cleanly"
+    },
+    timeout: {
+        stopped: (sessionId) => `🛑 Session ${sessionId} stopped due to timeout`,
+        failed: "⚠️ Warning: Could not stop session after timeout"
+    },
+    error: {
+        stopped: () => "🛑 Browser session stopped due to error",
+        failed: "⚠️ Warning: Could not stop session after error"
+    }
+};
+
+/**
+ * Stop a browser session and report the outcome; never throws.
+ * @param {string} reason - 'done', 'timeout' or 'error'; only changes the progress wording.
+ */
+async function stopSession(hb, sessionId, progressCallback = null, reason = 'done') {
+    const messages = STOP_MESSAGES[reason] || STOP_MESSAGES.done;
+    try {
+        await hb.sessions.stop(sessionId);
+        if (progressCallback) {
+            progressCallback(messages.stopped(sessionId));
+        }
+    } catch (stopError) {
+        if (progressCallback) {
+            progressCallback(`${messages.failed}: ${stopError.message}`);
+        }
+    }
+}
+
+module.exports = { getHyperbrowserClient, getFinalResult, parseFieldLines, stopSession, withTimeout };
@@ -1,5 +1,9 @@
-const { Hyperbrowser } = require('@hyperbrowser/sdk');
-const { v4: uuidv4 } = require('uuid');
+const { getHyperbrowserClient, getFinalResult, parseFieldLines, stopSession, withTimeout } = require('./hyperbrowserClient');
+
+// Fields the payment prompt asks the agent to report
+const RESPONSE_FIELDS = new Set([
+    'PAYMENT_URL', 'PAYMENT_GATEWAY', 'FORM_FILLED', 'CHECKOUT_URL', 'STEPS_COMPLETED', 'ISSUES_ENCOUNTERED', 'SCREENSHOT_READY'
+]);
 
 class PaymentURLExtractor {
     /**
@@ -7,25 +11,11 @@ class PaymentURLExtractor {
      * fills out forms with random data, and extracts the payment gateway URL.
      */
 
-    constructor(timeoutMinutes = 3.5) { // 3.5 minutes maximum timeout for French webshops with account creation
-        const apiKey = process.env.HYPERBROWSER_API_KEY;
-        if (!apiKey) {
-            console.error("❌ HYPERBROWSER_API_KEY environment variable is required but not found.");
-            throw new Error("HYPERBROWSER_API_KEY environment variable is required.");
-        }
-        
-        // Log the API key being used (first few characters for security)
-        console.log(`🔑 PaymentURLExtractor initializing with Hyperbrowser API Key (first 5 chars): ${apiKey.substring(0, 5)}...`);
-        
-        try {
-            this.hb = new Hyperbrowser({ apiKey });
-            console.log("✅ Hyperbrowser client initialized successfully");
-        } catch (error) {
-            console.error("❌ Failed to initialize Hyperbrowser client:", error.message);
-            throw error;
-        }
+    constructor(timeoutMinutes = 3.5, keepRawResponse = false) { // 3.5 minutes maximum timeout for French webshops with account creation
+        this.hb = getHyperbrowserClient();
         
         this.timeoutMinutes = timeoutMinutes;
+        this.keepRawResponse = keepRawResponse;
     }
 
     /**
@@ -158,29 +148,11 @@ class PaymentURLExtractor {
             return { error: 'No response from agent' };
         }
 
-        const result = {};
-        const lines = responseText.trim().split('\n');
-
-        for (const line of lines) {
-            const trimmedLine = line.trim();
-            if (trimmedLine.startsWith('PAYMENT_URL:')) {
-                result.payment_url = trimmedLine.replace('PAYMENT_URL:', '').trim();
-            } else if (trimmedLine.startsWith('PAYMENT_GATEWAY:')) {
-                result.payment_gateway = trimmedLine.replace('PAYMENT_GATEWAY:', '').trim();
-            } else if (trimmedLine.startsWith('FORM_FILLED:')) {
-                result.form_filled = trimmedLine.replace('FORM_FILLED:', '').trim();
-            } else if (trimmedLine.startsWith('CHECKOUT_URL:')) {
-                result.checkout_url = trimmedLine.replace('CHECKOUT_URL:', '').trim();
-            } else if (trimmedLine.startsWith('STEPS_COMPLETED:')) {
-                result.steps_completed = trimmedLine.replace('STEPS_COMPLETED:', '').trim();
-            } else if (trimmedLine.startsWith('ISSUES_ENCOUNTERED:')) {
-                result.issues_encountered = trimmedLine.replace('ISSUES_ENCOUNTERED:', '').trim();
-            } else if (trimmedLine.startsWith('SCREENSHOT_READY:')) {
-                result.screenshot_ready = trimmedLine.replace('SCREENSHOT_READY:', '').trim();
-            }
-        }
+        const result = parseFieldLines(responseText, RESPONSE_FIELDS);
 
-        result.raw_response = responseText;
+        if (this.keepRawResponse) {
+            result.raw_response = responseText;
+        }
         return result;
     }
 
@@ -309,7 +281,7 @@ SCREENSHOT_READY: Yes
      */
     async _runWithSessionTimeout(taskDescription, sessionOptions, progressCallback = null) {
         let sessionId = null;
-        let timeoutId = null;
+        let stopReason = 'error';
 
         try {
             if (progressCallback) {
@@ -324,27 +296,6 @@ SCREENSHOT_READY: Yes
                 progressCallback(`📱 Browser session created: ${sessionId}`);
             }
 
-            // Set up timeout with session termination
-            const timeoutMs = this.timeoutMinutes * 60 * 1000;
-            const timeoutPromise = new Promise((_, reject) => {
-                timeoutId = setTimeout(async () => {
-                    // Actively stop the Hyperbrowser session to prevent credit usage
-                    try {
-                        if (sessionId) {
-                            await this.hb.sessions.stop(sessionId);
-                            if (progressCallback) {
-                                progressCallback(`🛑 Session ${sessionId} stopped due to timeout`);
-                            }
-                        }
-                    } catch (stopError) {
-                        if (progressCallback) {
-                            progressCallback(`⚠️ Warning: Could not stop session after timeout: ${stopError.message}`);
-                        }
-                    }
-                    reject(new Error(`Task timed out after ${this.timeoutMinutes} minutes`));
-                }, timeoutMs);
-            });
-
             if (progressCallback) {
                 progressCallback("🤖 Starting payment gateway extraction task...");
                 progressCallback(`⏰ Timeout protection: Session will be stopped after ${this.timeoutMinutes} minutes to prevent excessive credit usage`);
@@ -371,12 +322,7 @@ SCREENSHOT_READY: Yes
             });
 
             // Race between the task and timeout
-            const result = await Promise.race([browserTaskPromise, timeoutPromise]);
-
-            // Clear timeout since we completed successfully
-            if (timeoutId) {
-                clearTimeout(timeoutId);
-            }
+            const result = await withTimeout(() => browserTaskPromise, this.timeoutMinutes);
 
             if (progressCallback) {
                 progressCallback("✅ Payment gateway extraction completed successfully!");
@@ -386,11 +332,10 @@ SCREENSHOT_READY: Yes
             const screenshotData = await this._capturePaymentScreenshot(sessionId, progressCallback);
 
             // Parse the agent response
+            const finalResult = getFinalResult(result);
             let parsedResult = {};
-            if (result && result.data && result.data.finalResult) {
-                parsedResult = this._parseAgentResponse(result.data.finalResult);
-            } else if (result && result.finalResult) {
-                parsedResult = this._parseAgentResponse(result.finalResult);
+            if (finalResult) {
+                parsedResult = this._parseAgentResponse(finalResult);
             } else {
                 // Fallback if no structured response
                 parsedResult = {
@@ -409,41 +354,19 @@ SCREENSHOT_READY: Yes
                 parsedResult.screenshot = screenshotData;
             }
 
-            // Stop the session since we're done
-            try {
-                await this.hb.sessions.stop(sessionId);
-                if (progressCallback) {
-                    progressCallback("🛑 Browser session stopped successfully");
-                }
-            } catch (stopError) {
-                if (progressCallback) {
-                    progressCallback(`⚠️ Warning: Could not stop session cleanly: ${stopError.message}`);
-                }
-            }
-
+            stopReason = 'done';
             return parsedResult;
 
         } catch (error) {
-            // Clear timeout if it exists
-            if (timeoutId) {
-                clearTimeout(timeoutId);
+            if (error.timedOut) {
+                stopReason = 'timeout';
             }
-
-            // Stop the session if it was created
+            throw error;
+        } finally {
+            // Stop the session if it was created, whichever way the task ended
             if (sessionId) {
-                try {
-                    await this.hb.sessions.stop(sessionId);
-                    if (progressCallback) {
-                        progressCallback("🛑 Browser session stopped due to error");
-                    }
-                } catch (stopError) {
-                    if (progressCallback) {
-                        progressCallback(`⚠️ Warning: Could not stop session after error: ${stopError.message}`);
-                    }
-                }
+                await stopSession(this.hb, sessionId, progressCallback, stopReason);
             }
-
-            throw error;
         }
     }
 
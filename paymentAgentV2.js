@@ -1,5 +1,9 @@
-const { Hyperbrowser } = require('@hyperbrowser/sdk');
-const { v4: uuidv4 } = require('uuid');
+const { getHyperbrowserClient, getFinalResult, parseFieldLines, stopSession, withTimeout } = require('./hyperbrowserClient');
+
+// Fields the payment prompt asks the agent to report, including the provider list
+const RESPONSE_FIELDS = new Set([
+    'PAYMENT_URL', 'PAYMENT_GATEWAY', 'PAYMENT_PROVIDERS', 'FORM_FILLED', 'CHECKOUT_URL', 'STEPS_COMPLETED', 'ISSUES_ENCOUNTERED', 'SCREENSHOT_READY'
+]);
 
 class PaymentURLExtractorV2 {
     /**
@@ -7,25 +11,11 @@ class PaymentURLExtractorV2 {
      * fill out forms with locale-specific data, and extract the payment gateway URL.
      */
 
-    constructor(timeoutMinutes = 5) { // 5 minutes for French webshops with account creation
-        const apiKey = process.env.HYPERBROWSER_API_KEY;
-        if (!apiKey) {
-            console.error("❌ HYPERBROWSER_API_KEY environment variable is required but not found.");
-            throw new Error("HYPERBROWSER_API_KEY environment variable is required.");
-        }
-        
-        // Log the API key being used (first few characters for security)
-        console.log(`🔑 PaymentURLExtractorV2 initializing with Hyperbrowser API Key (first 5 chars): ${apiKey.substring(0, 5)}...`);
-        
-        try {
-            this.hb = new Hyperbrowser({ apiKey });
-            console.log("✅ Hyperbrowser client initialized successfully");
-        } catch (error) {
-            console.error("❌ Failed to initialize Hyperbrowser client:", error.message);
-            throw error;
-        }
+    constructor(timeoutMinutes = 5, keepRawResponse = false) { // 5 minutes for French webshops with account creation
+        this.hb = getHyperbrowserClient();
         
         this.timeoutMinutes = timeoutMinutes;
+        this.keepRawResponse = keepRawResponse;
         console.log(`🔧 PaymentURLExtractorV2 initialized with timeout: ${this.timeoutMinutes} minutes`);
     }
 
@@ -58,29 +48,9 @@ class PaymentURLExtractorV2 {
             return { error: 'No response from agent' };
         }
 
-        const result = {};
-        const lines = responseText.trim().split('\n');
-
-        for (const line of lines) {
-            const trimmedLine = line.trim();
-            if (trimmedLine.startsWith('PAYMENT_URL:')) {
-                result.payment_url = trimmedLine.replace('PAYMENT_URL:', '').trim();
-            } else if (trimmedLine.startsWith('PAYMENT_GATEWAY:')) {
-                result.payment_gateway = trimmedLine.replace('PAYMENT_GATEWAY:', '').trim();
-            } else if (trimmedLine.startsWith('PAYMENT_PROVIDERS:')) {
-                const providersText = trimmedLine.replace('PAYMENT_PROVIDERS:', '').trim();
-                result.payment_providers = providersText.split(',').map(p => p.trim()).filter(p => p);
-            } else if (trimmedLine.startsWith('FORM_FILLED:')) {
-                result.form_filled = trimmedLine.replace('FORM_FILLED:', '').trim();
-            } else if (trimmedLine.startsWith('CHECKOUT_URL:')) {
-                result.checkout_url = trimmedLine.replace('CHECKOUT_URL:', '').trim();
-            } else if (trimmedLine.startsWith('STEPS_COMPLETED:')) {
-                result.steps_completed = trimmedLine.replace('STEPS_COMPLETED:', '').trim();
-            } else if (trimmedLine.startsWith('ISSUES_ENCOUNTERED:')) {
-                result.issues_encountered = trimmedLine.replace('ISSUES_ENCOUNTERED:', '').trim();
-            } else if (trimmedLine.startsWith('SCREENSHOT_READY:')) {
-                result.screenshot_ready = trimmedLine.replace('SCREENSHOT_READY:', '').trim();
-            }
+        const result = parseFieldLines(responseText, RESPONSE_FIELDS);
+        if (result.payment_providers !== undefined) {
+            result.payment_providers = result.payment_providers.split(',').map(p => p.trim()).filter(p => p);
         }
 
         // Robust fallback: extract URL tokens from the entire response
@@ -102,7 +72,9 @@ class PaymentURLExtractorV2 {
             } catch {}
         }
 
-        result.raw_response = responseText;
+        if (this.keepRawResponse) {
+            result.raw_response = responseText;
+        }
         return result;
     }
 
@@ -231,7 +203,7 @@ START NOW: ${checkoutUrl}
      */
     async _runWithSessionTimeout(taskDescription, sessionOptions, progressCallback = null, context = {}) {
         let sessionId = null;
-        let timeoutId = null;
+        let stopReason = 'error';
 
         try {
             if (progressCallback) {
@@ -246,26 +218,6 @@ START NOW: ${checkoutUrl}
                 progressCallback(`📱 Browser session created: ${sessionId}`);
             }
 
-            // Set up timeout with session termination
-            const timeoutMs = this.timeoutMinutes * 60 * 1000;
-            const timeoutPromise = new Promise((_, reject) => {
-                timeoutId = setTimeout(async () => {
-                    try {
-                        if (sessionId) {
-                            await this.hb.sessions.stop(sessionId);
-                            if (progressCallback) {
-                                progressCallback(`🛑 Session ${sessionId} stopped due to timeout`);
-                            }
-                        }
-                    } catch (stopError) {
-                        if (progressCallback) {
-                            progressCallback(`⚠️ Warning: Could not stop session after timeout: ${stopError.message}`);
-                        }
-                    }
-                    reject(new Error(`Task timed out after ${this.timeoutMinutes} minutes`));
-                }, timeoutMs);
-            });
-
             if (progressCallback) {
                 progressCallback("🤖 Starting Browser Use payment gateway extraction...");
                 progressCallback(`⏰ Timeout protection: Session will be stopped after ${this.timeoutMinutes} minutes`);
@@ -291,12 +243,7 @@ START NOW: ${checkoutUrl}
             });
 
             // Race between the task and timeout
-            const result = await Promise.race([browserUsePromise, timeoutPromise]);
-
-            // Clear timeout since we completed successfully
-            if (timeoutId) {
-                clearTimeout(timeoutId);
-            }
+            const result = await withTimeout(() => browserUsePromise, this.timeoutMinutes);
 
             if (progressCallback) {
                 progressCallback("✅ Browser Use payment gateway extraction completed successfully!");
@@ -306,11 +253,10 @@ START NOW: ${checkoutUrl}
             const screenshotData = await this._capturePaymentScreenshot(sessionId, progressCallback);
 
             // Parse the agent response
+            const finalResult = getFinalResult(result);
             let parsedResult = {};
-            if (result && result.data && result.data.finalResult) {
-                parsedResult = this._parseAgentResponse(result.data.finalResult, context && context.originalCheckoutUrl);
-            } else if (result && result.finalResult) {
-                parsedResult = this._parseAgentResponse(result.finalResult, context && context.originalCheckoutUrl);
+            if (finalResult) {
+                parsedResult = this._parseAgentResponse(finalResult, context && context.originalCheckoutUrl);
             } else {
                 // Fallback if no structured response
                 parsedResult = {
@@ -329,41 +275,19 @@ START NOW: ${checkoutUrl}
                 parsedResult.screenshot = screenshotData;
             }
 
-            // Stop the session since we're done
-            try {
-                await this.hb.sessions.stop(sessionId);
-                if (progressCallback) {
-                    progressCallback("🛑 Browser session stopped successfully");
-                }
-            } catch (stopError) {
-                if (progressCallback) {
-                    progressCallback(`⚠️ Warning: Could not stop session cleanly: ${stopError.message}`);
-                }
-            }
-
+            stopReason = 'done';
             return parsedResult;
 
         } catch (error) {
-            // Clear timeout if it exists
-            if (timeoutId) {
-                clearTimeout(timeoutId);
+            if (error.timedOut) {
+                stopReason = 'timeout';
             }
-
-            // Stop the session if it was created
+            throw error;
+        } finally {
+            // Stop the session if it was created, whichever way the task ended
             if (sessionId) {
-                try {
-                    await this.hb.sessions.stop(sessionId);
-                    if (progressCallback) {
-                        progressCallback("🛑 Browser session stopped due to error");
-                    }
-                } catch (stopError) {
-                    if (progressCallback) {
-                        progressCallback(`⚠️ Warning: Could not stop session after error: ${stopError.message}`);
-                    }
-                }
+                await stopSession(this.hb, sessionId, progressCallback, stopReason);
             }
-
-            throw error;
         }
     }
 